@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+benchmarks/generate_query.py
+
+Generates synthetic seano query output files, for measuring how the QA Notes view scales
+"""
+import argparse
+import json
+import random
+import sys
+
+
+def _paragraphs(rnd, count, words_per_paragraph=40):
+    vocabulary = ['release', 'build', 'QA', 'regression', 'crash', 'login', 'screen', 'cache', 'server', 'client',
+                  'verify', 'the', 'a', 'that', 'when', 'should', 'not', 'button', '*settings*', '``config``']
+    return '\n\n'.join([
+        ' '.join([rnd.choice(vocabulary) for _ in range(words_per_paragraph)]) + '.'
+        for _ in range(count)
+    ])
+
+
+def _code_block(rnd, flavor, lines):
+    code = '\n'.join(['    value_%d = compute(%d)  # line %d' % (i, rnd.randint(0, 999), i) for i in range(lines)])
+    if flavor == 'rst':
+        return '.. code-block:: python\n\n' + code
+    return '```python\n' + '\n'.join([x[4:] for x in code.splitlines()]) + '\n```'
+
+
+def generate_query(releases=50, notes_per_release=20, fan_in=1, rst_ratio=0.5, blob_paragraphs=2,
+                   code_lines=0, tickets_per_note=1, backstory_ratio=0.1, seed=0):
+    '''
+    Returns a synthetic seano query output object (not serialized).
+
+    - ``releases``: number of releases in the history (the newest one is named ``HEAD``)
+    - ``notes_per_release``: number of notes in each release
+    - ``fan_in``: maximum number of parents of each release (values above 1 simulate merges)
+    - ``rst_ratio``: fraction of notes written in reStructuredText (the rest are Markdown)
+    - ``blob_paragraphs``: number of paragraphs in each technical blob
+    - ``code_lines``: number of lines in a code block appended to each QA blob (0 for no code blocks)
+    - ``tickets_per_note``: number of tickets attached to each note
+    - ``backstory_ratio``: fraction of releases that also contain a note copied from a backstory
+    '''
+    rnd = random.Random(seed)
+    names = ['HEAD'] + ['1.%d.0' % (releases - i - 1) for i in range(1, releases)]
+    all_notes = []
+    result = []
+    for i, name in enumerate(names):
+        notes = []
+        for _ in range(notes_per_release):
+            flavor = 'rst' if rnd.random() < rst_ratio else 'md'
+            note = {
+                'id': '%030x' % (rnd.getrandbits(120),),
+                'tickets': ['https://example.com/tickets/EXAMPLE-%d' % (rnd.randint(1, 99999),)
+                            for _ in range(tickets_per_note)],
+                'employee-short-loc-hlist-' + flavor: {'en-US': [
+                    'Change number %d to the %s' % (rnd.randint(0, 9999), rnd.choice(['client', 'server', 'UI'])),
+                    {'Area %d' % (rnd.randint(0, 5),): ['Detail %d' % (rnd.randint(0, 50),)]},
+                ]},
+                'employee-technical-loc-' + flavor: {'en-US': _paragraphs(rnd, blob_paragraphs)},
+                'qa-technical-loc-' + flavor: {'en-US': _paragraphs(rnd, blob_paragraphs) + (
+                    '\n\n' + _code_block(rnd, flavor, code_lines) if code_lines else '')},
+            }
+            if rnd.random() < 0.5:
+                note['customer-short-loc-hlist-' + flavor] = {'en-US': ['Customer-facing change %d' % (rnd.randint(0, 999),)]}
+            if rnd.random() < 0.2:
+                note['mc-technical-loc-' + flavor] = {'en-US': _paragraphs(rnd, 1)}
+            notes.append(note)
+        if all_notes and rnd.random() < backstory_ratio:
+            backstory = dict(rnd.choice(all_notes))
+            backstory['is-copied-from-backstory'] = True
+            notes.append(backstory)
+        all_notes.extend(notes)
+        older = names[i + 1:]
+        after = older[:1] + rnd.sample(older[1:], min(len(older) - 1, rnd.randint(0, fan_in - 1))) if older else []
+        result.append({
+            'name': name,
+            'commit': None if i == 0 else '%040x' % (rnd.getrandbits(160),),
+            'after': [{'name': x} for x in after],
+            'before': [],
+            'notes': notes,
+        })
+    # Fill in the reverse edges of the ancestry graph:
+    named = {x['name']: x for x in result}
+    for release in result:
+        for parent in release['after']:
+            named[parent['name']]['before'].append({'name': release['name']})
+    return {
+        'project_name': {'en-US': 'Synthetic Project'},
+        'current_version': names[0],
+        'releases': result,
+    }
+
+
+def main(*args):
+    parser = argparse.ArgumentParser(description='Generates a synthetic seano query output file')
+    parser.add_argument('--out', action='store', default='-', help='Output file; use a single hyphen for stdout; default is to use stdout')
+    parser.add_argument('--releases', action='store', type=int, default=50)
+    parser.add_argument('--notes-per-release', action='store', type=int, default=20)
+    parser.add_argument('--fan-in', action='store', type=int, default=1)
+    parser.add_argument('--rst-ratio', action='store', type=float, default=0.5)
+    parser.add_argument('--blob-paragraphs', action='store', type=int, default=2)
+    parser.add_argument('--code-lines', action='store', type=int, default=0)
+    parser.add_argument('--tickets-per-note', action='store', type=int, default=1)
+    parser.add_argument('--backstory-ratio', action='store', type=float, default=0.1)
+    parser.add_argument('--seed', action='store', type=int, default=0)
+    ns = parser.parse_args(args)
+
+    query = generate_query(releases=ns.releases, notes_per_release=ns.notes_per_release, fan_in=ns.fan_in,
+                           rst_ratio=ns.rst_ratio, blob_paragraphs=ns.blob_paragraphs, code_lines=ns.code_lines,
+                           tickets_per_note=ns.tickets_per_note, backstory_ratio=ns.backstory_ratio, seed=ns.seed)
+    if ns.out in ['-']:
+        json.dump(query, sys.stdout)
+    else:
+        with open(ns.out, 'w') as f:
+            json.dump(query, f)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+benchmarks/run_benchmarks.py
+
+Measures how the QA Notes view scales, using synthetic seano query output files
+
+For each scenario, reports wall time, peak (Python) memory, and output size, for ``run()`` as a whole and for each
+of its ``write_*`` phases.
+"""
+import argparse
+import io
+import json
+import sys
+import time
+import tracemalloc
+from generate_query import generate_query
+from seano_formatter_qa_notes.qa_notes import QANotesRenderInfrastructure
+
+
+SCENARIOS = {
+    'tiny': dict(releases=5, notes_per_release=2),
+    'typical': dict(releases=50, notes_per_release=20),
+    'big-release': dict(releases=10, notes_per_release=300),
+    'long-history': dict(releases=3000, notes_per_release=5),
+    'merge-heavy': dict(releases=1000, notes_per_release=5, fan_in=4),
+    'code-heavy': dict(releases=10, notes_per_release=40, rst_ratio=1.0, code_lines=60),
+}
+
+# The leaf phases of QANotesRenderInfrastructure.run(), in the order they happen within each release:
+PHASES = ['write_release_head', 'write_release_section_toggles', 'write_release_notes', 'write_qa_notes']
+
+
+class _PhaseStats(object):
+    def __init__(self):
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.output_chars = 0
+
+
+class _CountingBuffer(object):
+    '''
+    Forwards body writes to a real HTML buffer, keeping track of how much was written.
+    '''
+    def __init__(self, f):
+        self.f = f
+        self.chars = 0
+
+    def write_body(self, txt):
+        self.chars = self.chars + len(txt)
+        self.f.write_body(txt)
+
+
+def _timed_phase(name):
+    def method(self, f, *args, **kwargs):
+        stats = self.phase_stats.setdefault(name, _PhaseStats())
+        counter = _CountingBuffer(f)
+        if hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = getattr(QANotesRenderInfrastructure, name)(self, counter, *args, **kwargs)
+        stats.seconds = stats.seconds + time.perf_counter() - start
+        if hasattr(tracemalloc, 'reset_peak'):
+            stats.peak_bytes = max(stats.peak_bytes, tracemalloc.get_traced_memory()[1] - baseline)
+        stats.output_chars = stats.output_chars + counter.chars
+        return result
+    return method
+
+
+class _PhaseTimingInfrastructure(QANotesRenderInfrastructure):
+    '''
+    A ``QANotesRenderInfrastructure`` that keeps track of the cost of each of its ``write_*`` phases.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.phase_stats = {}
+
+for _name in PHASES:
+    setattr(_PhaseTimingInfrastructure, _name, _timed_phase(_name))
+
+
+def run_scenario(params, repeat, **infrastructure_kwargs):
+    '''
+    Renders the QA Notes page for a synthetic query generated with the given parameters, and returns a dictionary
+    describing the best (fastest) of ``repeat`` runs.
+    '''
+    srcdata = json.dumps(generate_query(**params))
+    best = None
+    for _ in range(repeat):
+        infrastructure = _PhaseTimingInfrastructure(**infrastructure_kwargs)
+        out = io.StringIO()
+        tracemalloc.start()
+        start = time.perf_counter()
+        infrastructure.run(srcdata, out=out)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result = {
+            'input_bytes': len(srcdata.encode('utf-8')),
+            'run': {
+                'seconds': elapsed,
+                'peak_bytes': peak,
+                'output_bytes': len(out.getvalue().encode('utf-8')),
+            },
+            'phases': {name: {
+                'seconds': s.seconds,
+                'peak_bytes': s.peak_bytes if hasattr(tracemalloc, 'reset_peak') else None,
+                'output_chars': s.output_chars,
+            } for name, s in infrastructure.phase_stats.items()},
+        }
+        if best is None or result['run']['seconds'] < best['run']['seconds']:
+            best = result
+    return best
+
+
+def _print_report(name, result):
+    def fmt_bytes(n):
+        return 'n/a' if n is None else '%.1f KB' % (n / 1024.0,)
+    print('%s (input %s)' % (name, fmt_bytes(result['input_bytes'])))
+    print('    %-32s %10.1f ms  peak %12s  output %12s' % (
+        'run()', result['run']['seconds'] * 1000, fmt_bytes(result['run']['peak_bytes']),
+        fmt_bytes(result['run']['output_bytes'])))
+    for phase in PHASES:
+        if phase in result['phases']:
+            p = result['phases'][phase]
+            print('    %-32s %10.1f ms  peak %12s  output %12s' % (
+                phase + '()', p['seconds'] * 1000, fmt_bytes(p['peak_bytes']), fmt_bytes(p['output_chars'])))
+
+
+def main(*args):
+    parser = argparse.ArgumentParser(description='Benchmarks the QA Notes view against synthetic seano query output')
+    parser.add_argument('scenarios', nargs='*', default=['tiny', 'typical', 'big-release'],
+                        help='Scenarios to run; choose from: %s' % (', '.join(sorted(SCENARIOS.keys())),))
+    parser.add_argument('--repeat', action='store', type=int, default=3, help='Report the best of this many runs; default is %(default)s')
+    parser.add_argument('--jobs', action='store', type=int, default=1, help='Number of processes to render markup with; default is %(default)s')
+    parser.add_argument('--compact', action='store_true', help='Benchmark the compact output mode')
+    parser.add_argument('--json', action='store', default=None, help='Also save the results to this file, as Json')
+    ns = parser.parse_args(args)
+
+    results = {}
+    for name in ns.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: %s' % (name,))
+        results[name] = run_scenario(SCENARIOS[name], ns.repeat, jobs=ns.jobs, compact=ns.compact)
+        _print_report(name, results[name])
+
+    if ns.json:
+        with open(ns.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
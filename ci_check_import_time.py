@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+ci_check_import_time.py
+
+Makes sure that importing the QA Notes formatter stays cheap: the markup stacks (DocUtils, Markdown, and Pygments)
+must not be imported until something is actually rendered.
+
+Run this from CI after installing the package; exits non-zero on regression.
+"""
+import subprocess
+import sys
+
+HEAVY_MODULES = ['docutils', 'markdown', 'pygments', 'pymdownx']
+
+PROBE = '''
+import sys, time
+start = time.time()
+import seano_formatter_qa_notes.qa_notes
+elapsed = time.time() - start
+print('%.1f' % (elapsed * 1000))
+print(' '.join(sorted(set(x.partition('.')[0] for x in sys.modules) & set(sys.argv[1:]))))
+'''
+
+
+def main():
+    # Use a fresh interpreter, so that nothing imported by this script (or by a test runner) muddies the results
+    out = subprocess.check_output([sys.executable, '-c', PROBE] + HEAVY_MODULES, universal_newlines=True)
+    elapsed_ms, _, loaded = out.strip('\n').partition('\n')
+    print('Importing seano_formatter_qa_notes.qa_notes took %s ms' % (elapsed_ms,))
+    if loaded.strip():
+        print('FAIL: importing seano_formatter_qa_notes.qa_notes also imported: %s' % (loaded.strip(),))
+        return 1
+    print('OK: no markup stacks were imported')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -55,5 +55,8 @@ setup(
         Path('shared/vendor_setup_py_install_requires.txt').read_text(encoding='utf-8'),
         # No additional dependencies specific to this Seano view
     ]),
+    extras_require = {
+        'brotli': ['brotli'], # For --brotli
+    },
     python_requires='>=3.0',
 )
@@ -0,0 +1,100 @@
+"""
+src/seano_formatter_qa_notes/ancestry_index.py
+
+Infrastructure to answer questions about the release ancestry graph without walking it over and over
+"""
+from .shared.schema_plumbing import seano_minimum_descendant_list
+
+
+class QANotesAncestryIndex(object):
+    '''
+    The ancestry graph of all of the releases in a ``SeanoMetaCache``, as one bitset of ancestors per release.
+
+    Each release is assigned one bit; the bitset of a release has the bits of the release itself and of all of its
+    ancestors set.  Bitsets are computed once, in topological order (each release's bitset is its own bit OR'd
+    with its parents' bitsets), after which asking whether one release is an ancestor of another is a single
+    bitwise AND.  Memory use is one bit per pair of releases (about 1 MB for 3000 releases).
+
+    Releases that the index can't describe exactly the way the shared release plumbing would (releases with
+    ancestors that aren't in the query output, or with no ``after`` list) are left out; queries involving them
+    return ``None``, so that the caller can fall back to the shared plumbing, which reports the problem.  A graph
+    containing a cycle is not indexed at all.
+    '''
+    def __init__(self, cmc):
+        named_releases = cmc.named_releases
+        self._bits = {name: 1 << i for i, name in enumerate(named_releases)}
+        self._ancestors = {}
+        self.is_usable = True
+        for root in named_releases:
+            if root in self._ancestors:
+                continue
+            # Iterative depth-first walk towards the ancestors (histories are deeper than the recursion limit):
+            stack = [(root, False)]
+            in_progress = set()
+            while stack:
+                name, is_expanded = stack.pop()
+                if is_expanded:
+                    in_progress.discard(name)
+                    self._ancestors[name] = self._compute_ancestors(name, named_releases[name].get('after'))
+                    continue
+                if name in self._ancestors:
+                    continue
+                if name in in_progress:
+                    self.is_usable = False # Cycle
+                    self._ancestors = {}
+                    return
+                in_progress.add(name)
+                stack.append((name, True))
+                for parent in named_releases[name].get('after') or []:
+                    if parent['name'] in named_releases and parent['name'] not in self._ancestors:
+                        stack.append((parent['name'], False))
+
+    def _compute_ancestors(self, name, after):
+        if after is None:
+            return None
+        result = self._bits[name]
+        for parent in after:
+            mask = self._ancestors.get(parent['name'])
+            if mask is None:
+                return None # Unknown (or un-indexable) parent
+            result = result | mask
+        return result
+
+    def minimum_descendant_list(self, bag):
+        '''
+        Equivalent to ``seano_minimum_descendant_list(bag, cmc)``, or ``None`` if this index can't answer.
+        '''
+        if not self.is_usable:
+            return None
+        bag = list(bag)
+        for name in bag:
+            if self._ancestors.get(name) is None:
+                return None
+        # Same algorithm (and therefore, same results, down to the order and duplicates) as the shared plumbing, but
+        # using bitsets for the ancestry check:
+        result = bag
+        for item in bag:
+            if len(result) < 2:
+                break
+            smaller_result = [x for x in result if x != item]
+            mask = 0
+            for x in smaller_result:
+                mask = mask | self._ancestors[x]
+            if mask & self._bits[item]:
+                result = smaller_result
+        return result
+
+
+def qa_notes_minimum_descendant_list(bag, cmc):
+    '''
+    Equivalent to ``seano_minimum_descendant_list(bag, cmc)``, using a ``QANotesAncestryIndex`` that is built (once)
+    the first time this is called with a given ``SeanoMetaCache``, and kept on it.
+    '''
+    index = getattr(cmc, 'qa_notes_ancestry_index', None)
+    if index is None:
+        index = QANotesAncestryIndex(cmc)
+        cmc.qa_notes_ancestry_index = index
+    result = index.minimum_descendant_list(bag)
+    if result is None:
+        return seano_minimum_descendant_list(bag, cmc)
+    return result
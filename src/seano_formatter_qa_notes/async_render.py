@@ -0,0 +1,133 @@
+"""
+src/seano_formatter_qa_notes/async_render.py
+
+Infrastructure to render QA Notes pages from within an asyncio event loop, without blocking it
+"""
+import asyncio
+import threading
+from .memo import DEFAULT_MEMO_MAX_ENTRIES
+from .query_reader import QANotesMetaCache
+from .shared.metacache import SeanoMetaCache
+
+# How many renders may run at the same time (by default)
+DEFAULT_MAX_CONCURRENT_RENDERS = 4
+
+# How many rendered chunks (roughly, releases) may be waiting for the consumer before rendering pauses
+DEFAULT_MAX_BUFFERED_CHUNKS = 8
+
+
+class _RenderCancelled(Exception):
+    '''
+    Raised within an abandoned render (see ``QANotesAsyncRenderer.iter_qa_notes()``), to stop it early.
+    '''
+
+
+class _AsyncQueueStream(object):
+    '''
+    A writable text stream, for use on a worker thread, that hands everything written to it to an ``asyncio.Queue``
+    on the event loop.  Writes block while the queue is full, so a slow consumer slows down the render rather than
+    letting rendered chunks pile up in memory.
+    '''
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.is_cancelled = threading.Event()
+
+    def write(self, txt):
+        if self.is_cancelled.is_set():
+            raise _RenderCancelled()
+        if txt:
+            asyncio.run_coroutine_threadsafe(self.queue.put(txt), self.loop).result()
+        return len(txt)
+
+    def close(self):
+        if not self.is_cancelled.is_set():
+            asyncio.run_coroutine_threadsafe(self.queue.put(None), self.loop).result()
+
+
+class QANotesAsyncRenderer(object):
+    '''
+    Renders QA Notes pages on behalf of coroutines, such as the request handlers of an asyncio web service.
+
+    Each render runs on ``executor`` (a ``concurrent.futures.Executor`` whose workers are threads of this process;
+    by default, the event loop's default executor), so the event loop stays responsive while markup is compiled.
+    At most ``max_concurrent_renders`` renders run at the same time; further renders wait their turn without
+    holding a worker.
+
+    Render infrastructures are pooled (one per concurrent render, created as needed), so warmed-up markup engines
+    and rendered markup and tickets are re-used by later renders.  Because the pool lives as long as the renderer,
+    each of an infrastructure's memos (of rendered markup, rendered tickets, and parsed note fields) keeps only the
+    ``memo_max_entries`` most recently used entries, so that memory use doesn't grow with every distinct query ever
+    rendered.  (Entries are evicted rather than the memos being reset after every render, so that notes that appear
+    in many queries, such as those of the same project, are still rendered only once.)
+
+    The remaining keyword arguments are passed to each ``QANotesRenderInfrastructure`` (``fragment_cache``,
+    ``compact``, ``release_count``, ``lazy``, and so on).
+    '''
+    def __init__(self, executor=None, max_concurrent_renders=DEFAULT_MAX_CONCURRENT_RENDERS,
+                 max_buffered_chunks=DEFAULT_MAX_BUFFERED_CHUNKS, memo_max_entries=DEFAULT_MEMO_MAX_ENTRIES,
+                 **infrastructure_options):
+        self.executor = executor
+        self.max_concurrent_renders = max_concurrent_renders
+        self.max_buffered_chunks = max_buffered_chunks
+        self.infrastructure_options = dict(infrastructure_options, memo_max_entries=memo_max_entries)
+        self._semaphore = None
+        self._idle_infrastructures = []
+
+    def _checkout_infrastructure(self):
+        if self._idle_infrastructures:
+            return self._idle_infrastructures.pop()
+        from .qa_notes import QANotesRenderInfrastructure #pylint: disable=C0415
+        return QANotesRenderInfrastructure(**self.infrastructure_options)
+
+    async def iter_qa_notes(self, query):
+        '''
+        Renders the QA Notes page for the given seano query (an already-deserialized dictionary, or a
+        ``SeanoMetaCache``), yielding the page in chunks as it is rendered: first everything up to the first
+        release, then each release as it finishes, then the end of the page.
+
+        Closing the iterator early (for example, when the client disconnects) abandons the render.
+        '''
+        if self._semaphore is None:
+            # (Created on first use, so that it belongs to the event loop that uses it)
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_renders)
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            queue = asyncio.Queue(maxsize=self.max_buffered_chunks)
+            stream = _AsyncQueueStream(loop, queue)
+            infrastructure = self._checkout_infrastructure()
+            cmc = query if isinstance(query, SeanoMetaCache) else QANotesMetaCache(query)
+
+            def render():
+                try:
+                    infrastructure.run(cmc, out=stream)
+                finally:
+                    stream.close()
+
+            future = loop.run_in_executor(self.executor, render)
+            try:
+                while True:
+                    chunk = await queue.get()
+                    if chunk is None:
+                        break
+                    yield chunk
+                await future # (Raises the render's error, if any)
+            finally:
+                if not future.done():
+                    # Abandoned; make the render's next write fail, and unblock its current one:
+                    stream.is_cancelled.set()
+                    while not future.done():
+                        while not queue.empty():
+                            queue.get_nowait()
+                        await asyncio.wait([future], timeout=0.1)
+                    try:
+                        future.result()
+                    except Exception: #pylint: disable=W0703
+                        pass # (Nobody is waiting for the page anymore)
+                self._idle_infrastructures.append(infrastructure)
+
+    async def render_qa_notes(self, query):
+        '''
+        Renders the QA Notes page for the given seano query, and returns the entire page as a string.
+        '''
+        return ''.join([chunk async for chunk in self.iter_qa_notes(query)])
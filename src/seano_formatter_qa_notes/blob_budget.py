@@ -0,0 +1,149 @@
+"""
+src/seano_formatter_qa_notes/blob_budget.py
+
+Infrastructure to bound the cost of rendering any single markup blob, so that one pathological note (a pasted log,
+a giant code block for Pygments to highlight) can't blow up the latency and size of the whole QA Notes page
+"""
+import signal
+import threading
+import time
+from .shared.html_buf import SeanoHtmlFragment, html_escape as escape
+
+# Marks fallbacks of blobs that ran out of time.  Whether a blob runs out of time depends on the machine and its
+# load, so such fallbacks must never outlive the render that produced them (see qa_notes_is_fragment_cacheable()).
+QA_NOTES_TIMEOUT_FALLBACK_CLASS = 'blob-fallback-timeout'
+
+
+class _BlobRenderTimeout(BaseException):
+    '''
+    Raised (by a timer signal) within a render that ran out of time.  This is a ``BaseException``, so that markup
+    engines that catch and report ``Exception`` don't mistake it for a markup error.
+    '''
+
+
+class QANotesBlobFallback(object):
+    '''
+    A record of one markup blob that was shown as plain text instead of being rendered, because it exceeded a
+    ``QANotesBlobBudget``:
+
+    - ``note_ids``: the IDs of the notes the blob came from
+    - ``reason``: ``'bytes'`` (the blob was too large to render) or ``'seconds'`` (rendering it took too long)
+    - ``byte_count``: the size of the blob, in bytes (as UTF-8)
+    - ``seconds``: the time spent on the blob, including the abandoned render (if any)
+    '''
+    def __init__(self, note_ids, reason, byte_count, seconds):
+        self.note_ids = note_ids
+        self.reason = reason
+        self.byte_count = byte_count
+        self.seconds = seconds
+
+    def describe(self):
+        return '%s: a %d-byte blob was shown without formatting, because it %s' % (
+            'note %s' % (', '.join(self.note_ids),) if self.note_ids else 'unknown note', self.byte_count,
+            'is too large' if self.reason == 'bytes' else 'took too long to render')
+
+    def as_dict(self):
+        return {
+            'note_ids': self.note_ids,
+            'reason': self.reason,
+            'byte_count': self.byte_count,
+            'seconds': self.seconds,
+        }
+
+
+class QANotesBlobBudget(object):
+    '''
+    Limits on the rendering of a single markup blob: blobs larger than ``max_bytes`` (as UTF-8) aren't rendered at
+    all, but shown as escaped plain text, truncated to ``max_bytes``; blobs that take longer than ``max_seconds``
+    to render are abandoned, and shown as escaped plain text.  Either limit may be ``None`` (no limit).
+
+    Renders can only be interrupted with a timer signal, which requires ``signal.setitimer()`` (not available on
+    Windows), running on the main thread, and no other user of the real-time interval timer.  Elsewhere,
+    ``max_seconds`` is not enforced.
+    '''
+    def __init__(self, max_bytes=None, max_seconds=None):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+
+    def can_interrupt(self):
+        '''
+        Returns whether or not ``max_seconds`` can be enforced on the current thread.
+        '''
+        return self.max_seconds is not None and hasattr(signal, 'setitimer') \
+            and threading.current_thread() is threading.main_thread() \
+            and signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+    def is_too_large(self, markup):
+        return self.max_bytes is not None and len(markup.payload.encode('utf-8')) > self.max_bytes
+
+    def too_large_fallback(self, markup, mode):
+        '''
+        Returns ``(fragment, fallback)`` for a blob that is too large to render: the start of the blob as plain
+        text, and a ``QANotesBlobFallback`` describing what happened.
+        '''
+        byte_count = len(markup.payload.encode('utf-8'))
+        fragment = _render_fallback(markup.payload, mode, self.max_bytes, '(Truncated to the first %d of %d bytes, '
+                                    'and shown without formatting)' % (self.max_bytes, byte_count))
+        return fragment, QANotesBlobFallback(list(markup.tags), 'bytes', byte_count, 0.0)
+
+    def timed_out_fallback(self, markup, mode, seconds):
+        '''
+        Returns ``(fragment, fallback)`` for a blob that took too long to render: the blob as plain text, and a
+        ``QANotesBlobFallback`` describing what happened.
+        '''
+        fragment = _render_fallback(markup.payload, mode, None, '(Shown without formatting, because it took longer '
+                                    'than %g s to render)' % (self.max_seconds,))
+        fragment.html = ('<div class="%s">%s</div>' if mode == 'block' else '<span class="%s">%s</span>') % (
+            QA_NOTES_TIMEOUT_FALLBACK_CLASS, fragment.html)
+        return fragment, QANotesBlobFallback(list(markup.tags), 'seconds', len(markup.payload.encode('utf-8')),
+                                             seconds)
+
+    def render(self, markup, mode, render):
+        '''
+        Returns ``(fragment, fallback)``: ``render()`` (which renders ``markup`` in the given mode) and ``None`` if
+        the blob is within budget, else a plain text rendition of the blob and a ``QANotesBlobFallback``.
+        '''
+        if self.is_too_large(markup):
+            return self.too_large_fallback(markup, mode)
+        if not self.can_interrupt():
+            return render(), None
+        start = time.perf_counter()
+        try:
+            return _call_with_timeout(render, self.max_seconds), None
+        except _BlobRenderTimeout:
+            return self.timed_out_fallback(markup, mode, time.perf_counter() - start)
+
+
+def qa_notes_report_blob_fallbacks(fallbacks, stream, page):
+    '''
+    Writes one warning line per ``QANotesBlobFallback`` to the given text stream (usually stderr), so that
+    over-budget notes are noticed (and fixed) rather than silently shown as plain text.
+    '''
+    for fallback in fallbacks:
+        stream.write('%s: warning: %s\n' % (page, fallback.describe()))
+
+
+def _raise_timeout(signum, frame): #pylint: disable=W0613
+    raise _BlobRenderTimeout()
+
+
+def _call_with_timeout(func, seconds):
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            return func()
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _render_fallback(payload, mode, max_bytes, clarification):
+    if max_bytes is not None:
+        # (Cut on a character boundary)
+        payload = payload.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+    if mode == 'block':
+        return SeanoHtmlFragment(html='<pre>%s</pre><p class="clarification">%s</p>' % (
+            escape(payload), clarification))
+    return SeanoHtmlFragment(html='%s <span class="clarification">%s</span>' % (escape(payload), clarification))
@@ -0,0 +1,148 @@
+"""
+src/seano_formatter_qa_notes/fragment_cache.py
+
+Infrastructure to persist rendered markup fragments between runs of the QA Notes view
+"""
+import hashlib
+import json
+import os
+import tempfile
+from .blob_budget import QA_NOTES_TIMEOUT_FALLBACK_CLASS
+from .shared.html_buf import SeanoHtmlFragment
+
+# Bump this whenever the format of cache entries (or the way fragments are rendered) changes in a way
+# that invalidates existing entries.
+FRAGMENT_CACHE_FORMAT = 1
+
+DEFAULT_FRAGMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _renderer_version():
+    '''
+    Returns a string that changes whenever anything that can affect the rendered form of a markup blob changes:
+    the versions of the markup engines, and the source code of the modules that drive them.
+    '''
+    import docutils #pylint: disable=C0415,E0401
+    import markdown #pylint: disable=C0415
+    import pygments #pylint: disable=C0415
+    import pymdownx #pylint: disable=C0415
+    from . import renderer_pool #pylint: disable=C0415
+    from .shared import markup #pylint: disable=C0415
+    src_hashes = []
+    for module in [markup, renderer_pool]:
+        with open(module.__file__, 'rb') as f:
+            src_hashes.append(hashlib.sha1(f.read()).hexdigest())
+    return ' '.join([
+        'docutils=%s' % (getattr(docutils, '__version__', '?'),),
+        'markdown=%s' % (getattr(markdown, '__version__', '?'),),
+        'pygments=%s' % (getattr(pygments, '__version__', '?'),),
+        'pymdownx=%s' % (getattr(pymdownx, '__version__', '?'),),
+        'markup=%s' % ('+'.join(src_hashes),),
+    ])
+
+
+def qa_notes_is_fragment_cacheable(fragment):
+    '''
+    Returns whether or not the given rendered ``SeanoHtmlFragment`` may be reused outside of the render that
+    produced it.
+
+    Some fragments embed identifiers that are unique only within the current process (Mermaid diagrams are given
+    an auto-incrementing element id, for example); re-using such a fragment could produce duplicate ids in the
+    final page, so those fragments must always be rendered fresh.  Likewise, fragments that stand in for a blob
+    that ran out of time to render are only valid for the current render.
+    '''
+    if '<pre class="mermaid"' in fragment.html:
+        return False
+    # Blobs that ran out of time are only shown as plain text for the current render (see QANotesBlobBudget):
+    return QA_NOTES_TIMEOUT_FALLBACK_CLASS not in fragment.html
+
+
+class QANotesFragmentCache(object):
+    '''
+    A content-addressed on-disk cache of rendered markup fragments.
+
+    Rendering Markdown and reStructuredText (DocUtils + Pygments) is by far the most expensive part of building the
+    QA Notes page, yet from one build to the next, almost none of the notes change.  This cache maps a hash of the
+    markup flavor, the render mode, the renderer version, and the source markup to the rendered fragment, so that
+    only notes that actually changed need to be re-rendered.
+
+    Entries are stored one per file in a two-level directory tree (much like the seano database itself), and are
+    written atomically, so multiple processes may safely share one cache directory.  The cache does not bound its
+    own size while it is being written to; call ``trim()`` when you are done with it to evict the least recently
+    used entries until the cache fits in ``max_bytes``.
+    '''
+    def __init__(self, directory, max_bytes=DEFAULT_FRAGMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._renderer_version = None
+
+    def key(self, flavor, mode, payload):
+        '''
+        Returns the cache key of the fragment produced by rendering ``payload`` (the source markup) as ``flavor``
+        (the name of the markup class) in the given ``mode`` (``'block'`` or ``'line'``).
+        '''
+        if self._renderer_version is None:
+            self._renderer_version = _renderer_version()
+        blob = json.dumps([FRAGMENT_CACHE_FORMAT, self._renderer_version, flavor, mode, payload], default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, key):
+        '''
+        Returns the ``SeanoHtmlFragment`` stored under the given key, or ``None`` if there isn't one.
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # Missing, or corrupt (a corrupt entry will get overwritten by the next put)
+            return None
+        try:
+            os.utime(path, None) # Keeps trim() evicting the least *recently used* entries
+        except OSError:
+            pass
+        return SeanoHtmlFragment(html=data['html'], css=data['css'], js=data['js'])
+
+    def put(self, key, fragment):
+        '''
+        Stores the given ``SeanoHtmlFragment`` under the given key.
+
+        Failing to write to the cache is not fatal; the fragment simply won't be cached.
+        '''
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'html': fragment.html, 'css': fragment.css, 'js': fragment.js}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def trim(self):
+        '''
+        Evicts the least recently used entries until the total size of the cache is no larger than ``max_bytes``.
+        '''
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total = total + st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total = total - size
@@ -0,0 +1,82 @@
+"""
+src/seano_formatter_qa_notes/html_stream.py
+
+Infrastructure to write a single-file HTML file to a stream while it's still being built
+"""
+from .shared.html_buf import SeanoHtmlBuffer
+from .shared.text_buf import to_unicode
+
+
+class QANotesStreamingHtmlBuffer(object):
+    '''
+    A stand-in for ``SeanoHtmlBuffer`` that writes the document to a text stream as it goes, rather than holding
+    the entire document until the end.
+
+    The trade-off is that all head, CSS, and JS data must be written before the first write to the body (at that
+    point, the document up to and including the ``<body>`` tag is written to the stream).  After that, body data
+    is held in memory only until the next call to ``flush()``, so peak memory is bounded by the largest amount of
+    body data written between two flushes, rather than by the size of the whole document.
+
+    The output is byte-for-byte identical to what ``SeanoHtmlBuffer.all_data()`` would have returned.
+
+    You should use this class within a ``with`` statement; the document is finished (i.e., the closing
+    ``</body></html>`` tags are written) when the ``with`` statement exits, unless it exits with an exception.
+    '''
+    _DOC_SUFFIX = '</body></html>'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._preamble = SeanoHtmlBuffer()
+        self._body = []
+        self._is_body_started = False
+
+    def __enter__(self):
+        self._preamble.__enter__()
+        return self
+
+    def __exit__(self, ertype, value, traceback):
+        try:
+            if ertype is None:
+                self.flush()
+                self.stream.write(self._DOC_SUFFIX)
+        finally:
+            self._preamble.__exit__(ertype, value, traceback)
+
+    def _assert_body_not_started(self):
+        if self._is_body_started:
+            raise RuntimeError('Head, CSS, and JS data must be written before any body data when streaming')
+
+    def write_head(self, txt):
+        self._assert_body_not_started()
+        self._preamble.write_head(txt)
+
+    def write_css(self, txt):
+        self._assert_body_not_started()
+        self._preamble.write_css(txt)
+
+    def write_js(self, txt):
+        self._assert_body_not_started()
+        self._preamble.write_js(txt)
+
+    def write_body(self, txt):
+        if not self._is_body_started:
+            self._start_body()
+        self._body.append(to_unicode(txt))
+
+    def _start_body(self):
+        # An empty-bodied document from SeanoHtmlBuffer ends with '<body></body></html>'; everything up to the
+        # body's closing tag can be written now.
+        doc = self._preamble.all_data()
+        if not doc.endswith(self._DOC_SUFFIX):
+            raise RuntimeError('Unexpected document structure from SeanoHtmlBuffer: %s' % (doc[-50:],))
+        self.stream.write(doc[:-len(self._DOC_SUFFIX)])
+        self._is_body_started = True
+
+    def flush(self):
+        '''
+        Writes all body data buffered so far to the stream.
+        '''
+        if not self._is_body_started:
+            self._start_body()
+        self.stream.write(''.join(self._body))
+        self._body = []
@@ -0,0 +1,46 @@
+"""
+src/seano_formatter_qa_notes/memo.py
+
+Infrastructure to remember things computed while rendering, without letting long-lived processes grow without bound
+"""
+import collections
+
+# How many entries each memo of a long-lived render infrastructure (see --serve, and QANotesAsyncRenderer) keeps
+# (by default)
+DEFAULT_MEMO_MAX_ENTRIES = 10000
+
+
+class QANotesMemo(object):
+    '''
+    A dictionary that, once it holds more than ``max_entries`` entries, forgets the least recently used ones.  With
+    ``max_entries`` set to ``None``, nothing is ever forgotten (which suits rendering a fixed set of pages, and then
+    exiting).
+
+    Not thread-safe; like the render infrastructure that owns it, use it from one thread at a time.
+    '''
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        value = self._entries[key]
+        self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+        return self[key]
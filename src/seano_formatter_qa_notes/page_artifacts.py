@@ -0,0 +1,101 @@
+"""
+src/seano_formatter_qa_notes/page_artifacts.py
+
+Infrastructure to make QA Notes pages reproducible, and to write the files that accompany a page on a web server
+(a content hash, and precompressed copies)
+"""
+import datetime
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+
+
+class QANotesBuildTimeError(ValueError):
+    '''
+    Raised when the build time to show on a page is missing (in a deterministic build) or can't be parsed.  Raised
+    before any of the page is written.
+    '''
+
+
+def qa_notes_parse_build_time(value):
+    '''
+    Parses a build time given either as a number of seconds since the Unix epoch (as in the ``SOURCE_DATE_EPOCH``
+    convention; the result is in UTC), or as an ISO 8601 date and time (the result is in the given time zone, if
+    any).  Returns a ``datetime.datetime``.
+    '''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return datetime.datetime.fromtimestamp(int(value), tz=datetime.timezone.utc)
+        try:
+            # (Python < 3.11 doesn't understand the 'Z' suffix)
+            return datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            pass
+    raise ValueError('Unable to parse build time %r; expected a number of seconds since the Unix epoch, or an ISO 8601 '
+                     'date and time' % (value,))
+
+
+def qa_notes_import_brotli():
+    '''
+    Returns the ``brotli`` module, or ``None`` if it is not installed (it is an optional dependency; install this
+    package with the ``brotli`` extra to get it).
+    '''
+    try:
+        import brotli #pylint: disable=C0415,E0401
+    except ImportError:
+        return None
+    return brotli
+
+
+def _write_if_changed(path, data):
+    '''
+    Atomically writes the given bytes to the given file, unless the file already contains exactly those bytes (in
+    which case it is left alone, so that its modification time doesn't change either).
+    '''
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return
+    except OSError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def qa_notes_write_page_artifacts(path, content_hash=False, gzip_copy=False, brotli_copy=False):
+    '''
+    Writes the requested sibling files of the (already written) page at the given path:
+
+    - ``content_hash``: ``<path>.sha256``, in the format of ``sha256sum``
+    - ``gzip_copy``: ``<path>.gz``, with no timestamp or file name in its header, so that it's reproducible
+    - ``brotli_copy``: ``<path>.br`` (requires the optional ``brotli`` module)
+
+    Siblings whose content hasn't changed are not rewritten, so that upload steps that look at modification times
+    skip them.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if content_hash:
+        digest = hashlib.sha256(data).hexdigest()
+        _write_if_changed(path + '.sha256', ('%s  %s\n' % (digest, os.path.basename(path))).encode('utf-8'))
+    if gzip_copy:
+        buf = io.BytesIO()
+        with gzip.GzipFile(filename='', mode='wb', fileobj=buf, compresslevel=9, mtime=0) as f:
+            f.write(data)
+        _write_if_changed(path + '.gz', buf.getvalue())
+    if brotli_copy:
+        brotli = qa_notes_import_brotli()
+        if brotli is None:
+            raise RuntimeError('Writing .br files requires the brotli module (pip install brotli)')
+        _write_if_changed(path + '.br', brotli.compress(data))
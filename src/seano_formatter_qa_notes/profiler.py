@@ -0,0 +1,179 @@
+"""
+src/seano_formatter_qa_notes/profiler.py
+
+Infrastructure to measure where the time (and optionally, memory) goes while rendering the QA Notes page
+"""
+import json
+import time
+import tracemalloc
+
+
+PROFILE_FORMAT = 1
+
+# How many of the slowest notes are listed in the report
+DEFAULT_SLOWEST_NOTE_COUNT = 20
+
+
+class _PhaseTimer(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, ertype, value, traceback):
+        self.profiler.add_phase_time(self.name, time.perf_counter() - self.start)
+
+
+class QANotesProfiler(object):
+    '''
+    Collects timings of one rendering of the QA Notes page, and writes them out as a Json report.
+
+    Time is recorded in two ways:
+
+    - *phases* partition the render (reading the query, indexing releases, writing the head of each release, and so
+      on); the time of a phase is also recorded against the release being written at the time, if any
+    - *activities* are things done within phases (compiling markup, rendering ticket links, and walking the release
+      ancestry graph), which are recorded separately so that their cost can be seen across phases
+
+    Additionally, the number and total time of rendered markup blobs is recorded by markup flavor (only blobs that
+    were actually rendered, by this process or by a ``--jobs`` worker; blobs re-used from the memos or the fragment
+    cache are not counted), the time spent on each note in the QA notes section is recorded by note ID, and the hit
+    & miss counts of the render infrastructure's memoization (of markup, tickets, and parsed note fields) are
+    recorded by what is memoized, and markup blobs that were shown as plain text because they were over budget are
+    listed.
+
+    Profiling is opt-in; the render infrastructure checks for a profiler before measuring anything, so that
+    rendering without one costs (nearly) nothing extra.  If ``trace_memory`` is set, ``tracemalloc`` is used to
+    record peak memory use, overall and per release (per release requires Python 3.9 or later).  Beware that
+    tracing memory slows down rendering considerably.
+    '''
+    def __init__(self, trace_memory=False, slowest_note_count=DEFAULT_SLOWEST_NOTE_COUNT):
+        self.trace_memory = trace_memory
+        self.slowest_note_count = slowest_note_count
+        self.phase_seconds = {}
+        self.activity_seconds = {}
+        self.blobs = {}
+        self.releases = []
+        self.note_seconds = []
+        self.memo_counts = {}
+        self.blob_fallbacks = []
+        self.total_seconds = 0.0
+        self.peak_memory_bytes = None
+        self._current_release = None
+        self._is_tracing_memory = False
+        self._start = 0.0
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._is_tracing_memory = True
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, ertype, value, traceback):
+        self.total_seconds = time.perf_counter() - self._start
+        self.end_release()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+        if self._is_tracing_memory:
+            tracemalloc.stop()
+            self._is_tracing_memory = False
+
+    def phase(self, name):
+        '''
+        Returns a context manager that records the time spent within it against the given phase.
+        '''
+        return _PhaseTimer(self, name)
+
+    def add_phase_time(self, name, seconds):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+        if self._current_release is not None:
+            phases = self._current_release['phases']
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    def add_activity_time(self, name, seconds):
+        self.activity_seconds[name] = self.activity_seconds.get(name, 0.0) + seconds
+
+    def add_blob(self, flavor, mode, seconds):
+        stats = self.blobs.setdefault(flavor, {'block': 0, 'line': 0, 'seconds': 0.0})
+        stats[mode] = stats[mode] + 1
+        stats['seconds'] = stats['seconds'] + seconds
+
+    def add_note_time(self, note_id, release_name, seconds):
+        self.note_seconds.append((seconds, note_id, release_name))
+
+    def add_blob_fallback(self, fallback):
+        '''
+        Adds a ``QANotesBlobFallback`` (a markup blob that was shown as plain text because it was over budget) to
+        the report.
+        '''
+        self.blob_fallbacks.append(fallback.as_dict())
+
+    def add_memo_counts(self, memo_counts):
+        '''
+        Adds the given memoization hit & miss counts (``{name: {'hits': n, 'misses': n}}``) to the report.
+        '''
+        for name, counts in memo_counts.items():
+            totals = self.memo_counts.setdefault(name, {'hits': 0, 'misses': 0})
+            totals['hits'] = totals['hits'] + counts['hits']
+            totals['misses'] = totals['misses'] + counts['misses']
+
+    def begin_release(self, name, note_count):
+        '''
+        Starts recording phase times (and peak memory use) against the release with the given name.
+        '''
+        self.end_release()
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+            tracemalloc.reset_peak()
+        self._current_release = {'name': name, 'note_count': note_count, 'phases': {}}
+        self.releases.append(self._current_release)
+
+    def end_release(self):
+        if self._current_release is None:
+            return
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak') and tracemalloc.is_tracing():
+            self._current_release['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        self._current_release['seconds'] = sum(self._current_release['phases'].values())
+        self._current_release = None
+
+    def as_dict(self):
+        slowest = sorted(self.note_seconds, key=lambda x: x[0], reverse=True)[:self.slowest_note_count]
+        return {
+            'format': PROFILE_FORMAT,
+            'total_seconds': self.total_seconds,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'phases': self.phase_seconds,
+            'activities': self.activity_seconds,
+            'blobs': self.blobs,
+            'memo': self.memo_counts,
+            'blob_fallbacks': self.blob_fallbacks,
+            'releases': self.releases,
+            'slowest_notes': [{'id': note_id, 'release': release_name, 'seconds': seconds}
+                              for seconds, note_id, release_name in slowest],
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ertype, value, traceback):
+        pass
+
+_NO_PHASE = _NoPhase()
+
+
+def qa_notes_profile_phase(profiler, name):
+    '''
+    Returns ``profiler.phase(name)``, or a context manager that does nothing if ``profiler`` is ``None``.
+    '''
+    return _NO_PHASE if profiler is None else profiler.phase(name)
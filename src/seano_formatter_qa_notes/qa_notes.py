@@ -7,13 +7,145 @@ The public entry point here is the function named ``compile_qa_notes()``.
 """
 import argparse
 import datetime
+import hashlib
+import io
+import json
+import os
+import re
 import sys
-from .shared.components import *
-from .shared.hlist import seano_read_hlist, SeanoUnlocalizedHListNode
-from .shared.html_buf import SeanoHtmlBuffer, html_escape as escape
-from .shared.markup import SeanoMarkdown, SeanoReStructuredText
+import time
+from .ancestry_index import qa_notes_minimum_descendant_list
+from .blob_budget import QANotesBlobBudget, QANotesBlobFallback, qa_notes_report_blob_fallbacks
+from .fragment_cache import DEFAULT_FRAGMENT_CACHE_MAX_BYTES, QANotesFragmentCache, qa_notes_is_fragment_cacheable
+from .html_stream import QANotesStreamingHtmlBuffer
+from .memo import DEFAULT_MEMO_MAX_ENTRIES, QANotesMemo
+from .page_artifacts import QANotesBuildTimeError, qa_notes_import_brotli, qa_notes_parse_build_time, \
+    qa_notes_write_page_artifacts
+from .profiler import QANotesProfiler, qa_notes_profile_phase
+from .query_reader import QANotesMetaCache, qa_notes_read_query
+from .release_manifest import QANotesReleaseManifest, qa_notes_resolve_uid_tokens, qa_notes_uid_token
+from .shared.html_buf import SeanoHtmlFragment, html_escape as escape
 from .shared.metacache import SeanoMetaCache
-from .shared.schema_plumbing import seano_minimum_descendant_list
+
+# ABK: Importing the shared markup infrastructure imports DocUtils, Markdown, and Pygments, which takes longer than
+#      rendering a small QA Notes page does.  Anything that (transitively) imports .shared.markup is therefore
+#      imported where it's used, so that merely importing this module (to list formatters, to print --help, or to
+#      embed this view in a long-lived process) stays cheap.  Please keep it that way; CI checks it.
+
+# How many of the most recent releases are shown on the QA Notes page (by default)
+DEFAULT_RELEASE_COUNT = 5
+
+# The locale the QA Notes page is written in (by default), and the locale used for any text that isn't available in
+# the requested locale
+DEFAULT_LOCALE = 'en-US'
+
+# Shown in place of the QA notes of a note that has none
+_QA_NOTES_MISSING_MD = '*QA Notes missing*'
+
+# Markup types that are expensive enough to compile that it's worth caching and parallelizing their rendering
+_RENDERABLE_MARKUP = ('SeanoMarkdown', 'SeanoReStructuredText')
+
+# In compact mode, these handle all mouse hover and click events on the page (see render_js_link() and
+# render_mouse_hover_toggle_logic()), instead of attaching a handler to every element.
+_DELEGATED_EVENT_HANDLERS_JS = '''
+function toggleHover(event, isHovered) {
+    var elem = event.target.closest ? event.target.closest('[data-h]') : null;
+    if (!elem || (!isHovered && elem.contains(event.relatedTarget))) {
+        return;
+    }
+    Array.prototype.slice.call(elem.classList).forEach(function(c) {
+        if (c !== 'rnhover') {
+            Array.prototype.forEach.call(document.getElementsByClassName(c), function(e){e.classList.toggle('rnhover', isHovered);});
+        }
+    });
+}
+document.addEventListener('mouseover', function(event) { toggleHover(event, true); });
+document.addEventListener('mouseout', function(event) { toggleHover(event, false); });
+document.addEventListener('click', function(event) {
+    var elem = event.target.closest ? event.target.closest('a[data-a]') : null;
+    if (elem) {
+        event.preventDefault();
+        window[elem.getAttribute('data-a')](elem.getAttribute('data-i'));
+    }
+});'''
+
+
+# In lazy mode, the bodies of all releases but the first are embedded in the page in template elements (see
+# write_release_body()), and are only inserted into the DOM when the release is first shown.  (Scripts never run when
+# inserted via innerHTML, so they are replaced with fresh copies.)
+_MATERIALIZE_RELEASE_JS = '''
+function materializeRelease(id) {
+    var data = document.getElementById('release-data-' + id);
+    if (!data) {
+        return;
+    }
+    var body = document.getElementById('release-body-' + id);
+    body.innerHTML = data.innerHTML;
+    data.parentNode.removeChild(data);
+    Array.prototype.slice.call(body.getElementsByTagName('script')).forEach(function(old) {
+        var script = document.createElement('script');
+        Array.prototype.forEach.call(old.attributes, function(a) { script.setAttribute(a.name, a.value); });
+        script.text = old.text;
+        old.parentNode.replaceChild(script, old);
+    });
+}'''
+
+
+def _minify_css(txt):
+    # Conservative on purpose: this is only ever used on our own CSS, and on the CSS DocUtils recommends.
+    txt = re.sub(r'/\*.*?\*/', '', txt, flags=re.DOTALL)
+    txt = re.sub(r'\s+', ' ', txt)
+    txt = re.sub(r'\s*([{};,>])\s*', r'\1', txt)
+    return txt.replace(';}', '}').strip()
+
+
+def _minify_js(txt):
+    # Only correct for our own JS, in which every line ends with a brace or a semicolon.
+    return ''.join([x.strip() for x in txt.splitlines()])
+
+# The stylesheet that goes along with HTML rendered by DocUtils (including Pygments' syntax highlighting styles) does
+# not depend on the notes being rendered, so it's only rendered once per process.
+_markup_stylesheet = None
+
+
+# Returned by _render_markup_in_worker() for blobs that ran out of time
+_BLOB_TIMED_OUT = 'timed out'
+
+
+def _render_markup_in_worker(flavor, mode, payload, max_seconds=None):
+    '''
+    Process pool entry point used by ``--jobs``: renders a single markup blob, returning a picklable tuple of
+    ``(html, css, js, seconds)``, or ``None`` if it could not (or should not) be rendered here, or
+    ``_BLOB_TIMED_OUT`` if it took longer than ``max_seconds`` to render.
+
+    Errors are deliberately swallowed; the blob is simply rendered again during page assembly, which raises the
+    same exception that a serial render would have raised, at the same point in the page.
+    '''
+    from .renderer_pool import qa_notes_render_markup #pylint: disable=C0415
+    from .shared import markup as markup_module #pylint: disable=C0415
+    markup = getattr(markup_module, flavor)(payload=payload)
+    budget = QANotesBlobBudget(max_seconds=max_seconds)
+    start = time.perf_counter()
+    try:
+        result, fallback = budget.render(markup, mode, lambda: qa_notes_render_markup(markup, mode))
+    except Exception: #pylint: disable=W0703
+        return None
+    if fallback is not None:
+        return _BLOB_TIMED_OUT
+    if not qa_notes_is_fragment_cacheable(result):
+        return None
+    return (result.html, result.css, result.js, time.perf_counter() - start)
+
+
+class _CapturedBody(object):
+    '''
+    Stands in for an HTML buffer while a single release is rendered on its own, keeping the body data it is given.
+    '''
+    def __init__(self):
+        self.chunks = []
+
+    def write_body(self, txt):
+        self.chunks.append(txt)
 
 
 class QANotesRenderInfrastructure(object):
@@ -23,31 +155,388 @@ class QANotesRenderInfrastructure(object):
     The two other options are to use function-local storage, and class-local storage.  Between those two, class-
     local storage is easier to unit test.  (Not that we have unit tests, but I can dream, right?)
     '''
-    def __init__(self):
+    def __init__(self, fragment_cache=None, jobs=1, release_count=DEFAULT_RELEASE_COUNT, compact=False,
+                 profiler=None, manifest=None, lazy=False, build_time=None, deterministic=False,
+                 locale=DEFAULT_LOCALE, blob_max_bytes=None, blob_max_seconds=None, memo_max_entries=None):
         self._next_elem_uid = 0
+        self._is_tokenizing_uids = False
+        # Rendered markup, by (flavor, mode, payload); kept across calls to run(), so that rendering several pages
+        # with one infrastructure renders each distinct blob only once.  Long-lived infrastructures should bound
+        # this (and the other memos kept across calls to run()) with memo_max_entries:
+        self.memo_max_entries = memo_max_entries
+        self._fragment_memo = QANotesMemo(memo_max_entries)
+        self._ticket_memo = QANotesMemo(memo_max_entries) # Rendered tickets, by URL; also kept across calls to run()
+        self._hlist_memo = None # Parsed note fields (a QANotesHListMemo); also kept across calls to run()
+        self._constant_html = {} # Rendered constant Markdown (see render_constant_html_block())
+        # (Plain text stand-in, fallback key, QANotesBlobFallback) of each over-budget blob, by memo key; reset by run()
+        self._fallback_memo = {}
+        self._reported_fallback_keys = set() # Fallback keys of the blobs in blob_fallbacks; reset by run()
+        self._release_fallbacks = None # QANotesBlobFallback objects by fallback key, while rendering for the manifest
+        self.blob_fallbacks = [] # QANotesBlobFallback objects, one per over-budget blob; reset by run()
+        self._hover_class_aliases = {}
+        self.memo_counts = {}
+        self.compact = compact
+        self.lazy = lazy
+        self.build_time = build_time
+        self.deterministic = deterministic
+        self.locale = locale
+        self.blob_budget = None
+        if blob_max_bytes is not None or blob_max_seconds is not None:
+            self.blob_budget = QANotesBlobBudget(max_bytes=blob_max_bytes, max_seconds=blob_max_seconds)
+        self.fragment_cache = fragment_cache
+        self.jobs = jobs
+        self.release_count = release_count
+        self.profiler = profiler
+        self.manifest = manifest
 
     def compile_ticket_url(self, url):  #pylint: disable=R0201
         if url is None:
             # Visually matches font size of tickets in support/seano/views/shared/components.py, despite
             # this font size being...  larger?  It's probably an illusion caused by use of italics.
             return '<span style="font-size:90%"><em>No ticket associated</em></span>'
-        return seano_render_html_ticket(url)
+        return self.render_html_ticket(url)
+
+    def render_html_ticket(self, url):
+        '''
+        Equivalent to ``seano_render_html_ticket(url)``, except that each distinct URL is rendered only once.
+        '''
+        result = self._ticket_memo.get(url)
+        if result is not None:
+            self._count_memo('tickets', True)
+            return result
+        self._count_memo('tickets', False)
+        from .shared.components import seano_render_html_ticket #pylint: disable=C0415
+        result = seano_render_html_ticket(url)
+        self._ticket_memo[url] = result
+        return result
+
+    @property
+    def localizations(self):
+        '''
+        The priority list of localizations to read notes in: ``self.locale``, falling back to ``DEFAULT_LOCALE``.
+        '''
+        if self.locale == DEFAULT_LOCALE:
+            return [DEFAULT_LOCALE]
+        return [self.locale, DEFAULT_LOCALE]
+
+    def get_project_name(self, cmc):
+        names = cmc.everything['project_name']
+        for loc in self.localizations:
+            if loc in names:
+                return names[loc]
+        return names[DEFAULT_LOCALE] # (Raises the same KeyError as always)
+
+    def _count_memo(self, name, is_hit):
+        counts = self.memo_counts.setdefault(name, {'hits': 0, 'misses': 0})
+        counts['hits' if is_hit else 'misses'] = counts['hits' if is_hit else 'misses'] + 1
 
     def _get_elem_uid(self):
         self._next_elem_uid = self._next_elem_uid + 1
+        if self._is_tokenizing_uids:
+            return qa_notes_uid_token(self._next_elem_uid)
         return self._next_elem_uid
 
-    def run(self, srcdata):
+    def render_js_link(self, func, elem_uid, label):
+        '''
+        Returns a link that, when clicked, calls the given JS function (see ``run()``) with the given element UID.
+        '''
+        if self.compact:
+            return '<a href="#" data-a="%s" data-i="%s">%s</a>' % (func, elem_uid, label)
+        return '''<a href="javascript:%s('%s')">%s</a>''' % (func, elem_uid, label)
+
+    def get_hover_classes(self, release_notes_id, note_ids):
+        '''
+        Returns the list of CSS classes that identify hlist elements that came from the given notes in the release
+        notes section with the given element UID, for the purpose of highlighting related elements on mouse hover.
+        '''
+        if not self.compact:
+            return ['r%sp%s' % (release_notes_id, id) for id in note_ids]
+        # Note IDs are long; within a release, a short sequence number per note works just as well:
+        aliases = self._hover_class_aliases.setdefault(release_notes_id, {})
+        result = []
+        for note_id in note_ids:
+            if note_id not in aliases:
+                aliases[note_id] = 'r%sn%d' % (release_notes_id, len(aliases) + 1)
+            if aliases[note_id] not in result:
+                result.append(aliases[note_id])
+        return result
+
+    def render_mouse_hover_toggle_logic(self, identifiers):
+        # Here, we expect that we are within the attribute list of the start of an HTML element of some kind.
+        # Here, we add the class, onmouseover, and onmouseleave elements.
+        # The caller is expected to close this element (i.e., write the '>')
+        if self.compact:
+            # In compact mode, a single delegated event handler does the work, based on the class list
+            return ' class="%s" data-h' % (' '.join(identifiers),)
+        return ''.join([
+            ' class="',
+            ' '.join(identifiers),
+            '" onmouseover="',
+            ';'.join(['''Array.prototype.forEach.call(document.getElementsByClassName('%s'), function(e){e.classList.toggle('rnhover', true)})''' % (s,) for s in identifiers]), #pylint: disable=C0301
+            '" onmouseleave="',
+            ';'.join(['''Array.prototype.forEach.call(document.getElementsByClassName('%s'), function(e){e.classList.toggle('rnhover', false)})''' % (s,) for s in identifiers]), #pylint: disable=C0301
+            '"',
+        ])
+
+    def write_css(self, f, txt):
+        f.write_css(_minify_css(txt) if self.compact else txt)
+
+    def write_js(self, f, txt):
+        f.write_js(_minify_js(txt) if self.compact else txt)
+
+    def render_html_block(self, markup):
+        return self._render_markup(markup, 'block')
+
+    def render_html_line(self, markup):
+        return self._render_markup(markup, 'line')
+
+    def render_constant_html_block(self, payload):
+        '''
+        Equivalent to ``self.render_html_block(SeanoMarkdown(payload)).html``, for Markdown that is a constant of this
+        view (such as placeholders for missing notes), which is rendered only once.
+        '''
+        result = self._constant_html.get(payload)
+        if result is None:
+            from .shared.markup import SeanoMarkdown #pylint: disable=C0415
+            result = self.render_html_block(SeanoMarkdown(payload)).html
+            self._constant_html[payload] = result
+        return result
+
+    def hlist_block_formatter(self, node):
+        return self.render_html_block(node.element).html
+
+    def hlist_line_formatter(self, node):
+        return self.render_html_line(node.element).html
+
+    def _render_markup(self, markup, mode):
+        '''
+        All markup compiled into the QA Notes page funnels through here, so that rendered fragments can be re-used
+        when possible.  Only the markup types that are expensive to compile are worth caching; everything else
+        (plain text, missing values) is compiled directly.
+        '''
+        if self.profiler is None:
+            return self._lookup_or_render_markup(markup, mode)
+        start = time.perf_counter()
+        result = self._lookup_or_render_markup(markup, mode)
+        self.profiler.add_activity_time('markup', time.perf_counter() - start)
+        return result
+
+    def _profile_render(self, markup, mode, render):
+        '''
+        Returns ``render()``, which renders the given blob, recording the render in the profiler (if any).  Blobs
+        found in the memos or in the fragment cache are not renders; they show up in the memo counts instead.
+        '''
+        if self.profiler is None:
+            return render()
+        start = time.perf_counter()
+        try:
+            return render()
+        finally:
+            self.profiler.add_blob(markup.__class__.__name__, mode, time.perf_counter() - start)
+
+    def _lookup_or_render_markup(self, markup, mode):
+        if markup.__class__.__name__ not in _RENDERABLE_MARKUP:
+            return self._profile_render(markup, mode,
+                                        lambda: markup.toHtmlBlock() if mode == 'block' else markup.toHtmlLine())
+        memo_key = (markup.__class__.__name__, mode, markup.payload)
+        if memo_key in self._fallback_memo:
+            fragment, fallback_key, fallback = self._fallback_memo[memo_key]
+            self._report_fallback(fallback_key, fallback)
+            return fragment
+        if self.blob_budget is not None and self.blob_budget.is_too_large(markup):
+            return self._fall_back(memo_key, *self.blob_budget.too_large_fallback(markup, mode))
+        result = self._fragment_memo.get(memo_key)
+        self._count_memo('markup', result is not None)
+        if result is not None:
+            return result
+        key = None
+        if self.fragment_cache is not None:
+            key = self.fragment_cache.key(*memo_key)
+            result = self.fragment_cache.get(key)
+        if result is None:
+            from .renderer_pool import qa_notes_render_markup #pylint: disable=C0415
+            if self.blob_budget is None:
+                result = self._profile_render(markup, mode, lambda: qa_notes_render_markup(markup, mode))
+            else:
+                result, fallback = self._profile_render(markup, mode, lambda: self.blob_budget.render(
+                    markup, mode, lambda: qa_notes_render_markup(markup, mode)))
+                if fallback is not None:
+                    return self._fall_back(memo_key, result, fallback)
+            if not qa_notes_is_fragment_cacheable(result):
+                return result
+            if key is not None:
+                self.fragment_cache.put(key, result)
+        self._fragment_memo[memo_key] = result
+        return result
+
+    def _fall_back(self, memo_key, fragment, fallback):
+        '''
+        Records that the blob with the given memo key is over budget, and returns the fragment to show instead.
+        Each blob is recorded once per run, no matter how many times it appears on the page.
+        '''
+        # (Identifies the blob without its payload, so that releases stored in the manifest can refer to it cheaply)
+        fallback_key = hashlib.sha1(json.dumps(memo_key).encode('utf-8')).hexdigest()
+        self._fallback_memo[memo_key] = (fragment, fallback_key, fallback)
+        self._report_fallback(fallback_key, fallback)
+        return fragment
+
+    def _report_fallback(self, fallback_key, fallback):
+        '''
+        Records that the given over-budget blob is on the page (once per run), and in the release being rendered for
+        the manifest (if any).
+        '''
+        if self._release_fallbacks is not None:
+            self._release_fallbacks[fallback_key] = fallback
+        if fallback_key in self._reported_fallback_keys:
+            return
+        self._reported_fallback_keys.add(fallback_key)
+        self.blob_fallbacks.append(fallback)
+        if self.profiler is not None:
+            self.profiler.add_blob_fallback(fallback)
+
+    def _iter_release_markup(self, index):
+        '''
+        Yields ``(markup, mode)`` for every markup blob that ``write_release()`` will render for the release
+        described by the given ``QANotesReleaseIndex``.
+        '''
+        def walk(hlist, is_blob_field=False):
+            for node in hlist.walk():
+                yield node.element, 'block' if is_blob_field and node.level == 1 else 'line'
+        for x in walk(index.public_short):
+            yield x
+        for note in index.new_notes:
+            for x in walk(note.internal_short):
+                yield x
+            for x in walk(note.internal_technical, True):
+                yield x
+            for x in walk(note.qa, True):
+                yield x
+        for x in walk(index.member_care, True):
+            yield x
+
+    def _prerender_markup(self, items):
+        '''
+        Renders the given ``(markup, mode)`` pairs on a pool of ``self.jobs`` worker processes, saving the results
+        in ``self._fragment_memo`` for ``_render_markup()`` to find while the page is assembled.
+
+        Page assembly itself remains serial, so element UIDs (and everything else) come out identical to a serial
+        render.
+        '''
+        todo = []
+        todo_markup = {}
+        for markup, mode in items:
+            flavor = markup.__class__.__name__
+            memo_key = (flavor, mode, markup.payload)
+            if flavor not in _RENDERABLE_MARKUP or memo_key in self._fragment_memo:
+                continue
+            if self.blob_budget is not None and self.blob_budget.is_too_large(markup):
+                continue # (Not rendered at all)
+            self._fragment_memo[memo_key] = None # Claims the key, to dedup the work list
+            if self.fragment_cache is not None:
+                cached = self.fragment_cache.get(self.fragment_cache.key(flavor, mode, markup.payload))
+                if cached is not None:
+                    self._fragment_memo[memo_key] = cached
+                    continue
+            todo.append(memo_key)
+            todo_markup[memo_key] = markup
+        if not todo:
+            return
+        import concurrent.futures #pylint: disable=C0415
+        import functools #pylint: disable=C0415
+        max_seconds = self.blob_budget.max_seconds if self.blob_budget is not None else None
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            results = pool.map(functools.partial(_render_markup_in_worker, max_seconds=max_seconds), *zip(*todo),
+                               chunksize=len(todo) // (self.jobs * 4) + 1)
+            for memo_key, result in zip(todo, results):
+                if result == _BLOB_TIMED_OUT:
+                    if self.profiler is not None:
+                        self.profiler.add_blob(memo_key[0], memo_key[1], max_seconds)
+                    self._fall_back(memo_key, *self.blob_budget.timed_out_fallback(todo_markup[memo_key],
+                                                                                   memo_key[1], max_seconds))
+                    continue
+                if result is None:
+                    continue # (Rendered, and recorded, during page assembly instead)
+                if self.profiler is not None:
+                    # (Time spent by the worker; blobs render in parallel, so these add up to more than the phase)
+                    self.profiler.add_blob(memo_key[0], memo_key[1], result[3])
+                fragment = SeanoHtmlFragment(html=result[0], css=result[1], js=result[2])
+                self._fragment_memo[memo_key] = fragment
+                if self.fragment_cache is not None:
+                    self.fragment_cache.put(self.fragment_cache.key(*memo_key), fragment)
+
+    def get_markup_stylesheet(self):
+        '''
+        Returns the CSS needed by rendered markup (notably, Pygments' syntax highlighting styles).
+        '''
+        global _markup_stylesheet #pylint: disable=W0603
+        if _markup_stylesheet is None:
+            from .renderer_pool import qa_notes_render_markup #pylint: disable=C0415
+            from .shared.markup import SeanoReStructuredText #pylint: disable=C0415
+            # Rendered directly (not via render_html_block()), so that the blob budget never applies to it: a
+            # plain text stand-in has no CSS, and this CSS is kept for the life of the process.
+            _markup_stylesheet = qa_notes_render_markup(SeanoReStructuredText('sample text'), 'block').css
+        return _markup_stylesheet
+
+    def run(self, srcdata, out=None):
+        '''
+        Renders the QA Notes page for the given seano query output, which may be either in serialized form, or an
+        already-populated ``SeanoMetaCache``.
+
+        If ``out`` (a writable text stream) is given, the page is written to it as it is rendered, one release at a
+        time, and nothing is returned.  Otherwise, the entire page is returned as a string.
+        '''
+        if out is None:
+            out = io.StringIO()
+            self.run(srcdata, out=out)
+            return out.getvalue()
+        with qa_notes_profile_phase(self.profiler, 'import'):
+            from .release_index import QANotesHListMemo, QANotesReleaseIndex #pylint: disable=C0415
+            from .shared.hlist import seano_read_hlist #pylint: disable=C0415
+            from .shared.markup import SeanoMarkdown #pylint: disable=C0415
         self._next_elem_uid = 0
-        cmc = SeanoMetaCache(srcdata)
-        with SeanoHtmlBuffer() as f:
+        self._hover_class_aliases = {}
+        self._fallback_memo = {}
+        self._reported_fallback_keys = set()
+        self.memo_counts = {}
+        self.blob_fallbacks = []
+        with qa_notes_profile_phase(self.profiler, 'load'):
+            cmc = srcdata if isinstance(srcdata, SeanoMetaCache) else SeanoMetaCache(srcdata)
+            # (Resolved before anything is written, so that a missing build time doesn't leave half a page behind)
+            build_time = self.get_build_time(cmc)
+        with qa_notes_profile_phase(self.profiler, 'index'):
+            # Notes copied from backstories appear in several releases (and notes that didn't change appear in every
+            # page rendered by a long-lived infrastructure); parse them only once:
+            if self._hlist_memo is None:
+                self._hlist_memo = QANotesHListMemo(max_entries=self.memo_max_entries)
+            hlist_memo = self._hlist_memo
+            hit_count, miss_count = hlist_memo.hit_count, hlist_memo.miss_count
+            indices = [QANotesReleaseIndex(release, self.localizations, hlist_memo=hlist_memo)
+                       for release in cmc.releases[:self.release_count]]
+            self.memo_counts['hlists'] = {'hits': hlist_memo.hit_count - hit_count,
+                                          'misses': hlist_memo.miss_count - miss_count}
+            bu = seano_read_hlist([cmc.everything], ['build-uniqueness-list-md', 'build-uniqueness-list-rst'],
+                                  self.localizations)
+        fingerprints = [None] * len(indices)
+        if self.manifest is not None:
+            fingerprints = [self.get_release_fingerprint(index, cmc, release_count <= 1)
+                            for release_count, index in enumerate(indices, start=1)]
+        if self.jobs > 1:
+            with qa_notes_profile_phase(self.profiler, 'prerender'):
+                self._prerender_markup(
+                    [(SeanoMarkdown(_QA_NOTES_MISSING_MD), 'block')]
+                    + [(x.element, 'line') for x in bu]
+                    + [x for index, fingerprint in zip(indices, fingerprints)
+                       if fingerprint is None or not self.manifest.has(fingerprint)
+                       for x in self._iter_release_markup(index)])
+        preamble_start = time.perf_counter()
+        with QANotesStreamingHtmlBuffer(out) as f:
             f.write_head('''<title>QA Notes for ''')
-            f.write_head(escape(cmc.everything['project_name']['en-US']))
+            f.write_head(escape(self.get_project_name(cmc)))
             f.write_head(''' v''')
             f.write_head(escape(cmc.releases[0]['name']))
             f.write_head('''</title>''')
-            f.write_css(SeanoReStructuredText('sample text').toHtmlBlock().css) # Write out Pygments' CSS sheet
-            f.write_css('''
+            self.write_css(f, self.get_markup_stylesheet()) # Write out Pygments' CSS sheet
+            self.write_css(f, '''
 body {
     font-family: sans-serif;
     -webkit-text-size-adjust: 100%;
@@ -232,8 +721,9 @@ ol, ul {
         background: #0175bb; /* Bahama */
     }
 }''')
-            f.write_js('''function showRelease(id) {
-    document.getElementById('show-release-' + id).style.display = 'none';
+            self.write_js(f, '''function showRelease(id) {
+''' + ('''    materializeRelease(id);
+''' if self.lazy else '') + '''    document.getElementById('show-release-' + id).style.display = 'none';
     document.getElementById('hide-release-' + id).style.display = 'inline-block';
     document.getElementById('release-body-' + id).style.display = 'block';
 }
@@ -272,8 +762,12 @@ function hideTechnical(id) {
     document.getElementById('hide-technical-' + id).style.display = 'none';
     document.getElementById('technical-' + id).style.display = 'none';
 }''')
+            if self.lazy:
+                self.write_js(f, _MATERIALIZE_RELEASE_JS)
+            if self.compact:
+                self.write_js(f, _DELEGATED_EVENT_HANDLERS_JS)
             f.write_body('''<h2>QA Notes for ''')
-            f.write_body(escape(cmc.everything['project_name']['en-US']))
+            f.write_body(escape(self.get_project_name(cmc)))
             f.write_body(' v')
             f.write_body(escape(cmc.releases[0]['name']))
             f.write_body('</h2><p>Commit <code class="unimportant-long-sha1">')
@@ -282,178 +776,359 @@ function hideTechnical(id) {
                                 or (len(cmc.releases) > 1 and cmc.releases[1].get('commit', None)) # Dirty checkout
                                 or '???'))                                                       # Unexpected error
             f.write_body('</code>, built on ')
-            # IMPROVE: ABK: This line makes the output non-deterministic.  Is that bad?
-            # IMPROVE: ABK: Yes, that is bad.  The date should be present in the query output.
-            f.write_body(datetime.datetime.today().strftime('%m/%d/%Y at %I:%M %p %Z'))
+            f.write_body(build_time.strftime('%m/%d/%Y at %I:%M %p %Z'))
             f.write_body('</p>')
-            bu = seano_read_hlist([cmc.everything], ['build-uniqueness-list-md', 'build-uniqueness-list-rst'], ['en-US'])
             if bu:
                 f.write_body('<div class="build-uniq-div"><span class="head">Build Uniqueness</span>')
                 f.write_body('<div class="build-uniq-data">')
-                for data in sorted([x.element.toHtmlLine().html for x in bu], key=lambda s: s.lower()):
+                for data in sorted([self.render_html_line(x.element).html for x in bu], key=lambda s: s.lower()):
                     f.write_body('<span class="data">')
                     f.write_body(data)
                     f.write_body('</span>')
                 f.write_body('</div></div>')
-            release_count = 0
-            for release in cmc.releases:
-                release_count = release_count + 1
-                if release_count > 5:
-                    break
-                self.write_release(f, release, cmc, release_count <= 1)
+            if self.profiler is not None:
+                self.profiler.add_phase_time('preamble', time.perf_counter() - preamble_start)
+            for release_count, (index, fingerprint) in enumerate(zip(indices, fingerprints), start=1):
+                if self.profiler is not None:
+                    self.profiler.begin_release(index.release['name'], len(index.notes))
+                if fingerprint is None:
+                    self.write_release(f, index, cmc, release_count <= 1)
+                else:
+                    self.write_release_from_manifest(f, index, cmc, release_count <= 1, fingerprint)
+                with qa_notes_profile_phase(self.profiler, 'flush'):
+                    f.flush()
+            if self.profiler is not None:
+                self.profiler.end_release()
+                self.profiler.add_memo_counts(self.memo_counts)
+        return None
+
+    def get_release_since(self, release, cmc):
+        '''
+        Returns the names of the releases that the given release is a change since, as displayed in its head.
+        '''
+        start = time.perf_counter()
+        bag = qa_notes_minimum_descendant_list([x['name'] for x in release['after']], cmc)
+        if self.profiler is not None:
+            self.profiler.add_activity_time('ancestry', time.perf_counter() - start)
+        return ' and '.join(bag) or 'the dawn of time'
 
-            return f.all_data()
+    def get_release_fingerprint(self, index, cmc, is_first_release):
+        '''
+        Returns the key under which the rendered form of the given release is stored in ``self.manifest``, or
+        ``None`` if the release can't be stored there.
+        '''
+        return self.manifest.fingerprint(index.release, self.get_release_since(index.release, cmc),
+                                         [self.compact, self.lazy, is_first_release, self.localizations,
+                                          self.blob_budget.max_bytes if self.blob_budget is not None else None])
 
-    def write_release(self, f, release, cmc, is_first_release):
-        release_div_id = self.write_release_head(f, release, cmc, is_first_release)
-        self.write_release_body(f, release, is_first_release, release_div_id)
+    def write_release_from_manifest(self, f, index, cmc, is_first_release, fingerprint):
+        '''
+        Same as ``write_release()``, except that the rendered release is re-used from ``self.manifest`` when
+        possible (and saved to it when not).
+        '''
+        entry = self.manifest.get(fingerprint)
+        if entry is None:
+            # Render the release in isolation, with element UIDs as placeholders, so it can be spliced in anywhere:
+            base_uid = self._next_elem_uid
+            body = _CapturedBody()
+            self._next_elem_uid = 0
+            self._is_tokenizing_uids = True
+            self._hover_class_aliases = {}
+            self._release_fallbacks = {}
+            try:
+                self.write_release(body, index, cmc, is_first_release)
+                # (The release's over-budget blobs are stored with it, so that they are reported whenever it is used)
+                entry = (self._next_elem_uid, ''.join(body.chunks),
+                         [[k, v.as_dict()] for k, v in self._release_fallbacks.items()])
+            finally:
+                self._next_elem_uid = base_uid
+                self._is_tokenizing_uids = False
+                self._hover_class_aliases = {}
+                self._release_fallbacks = None
+            self.manifest.put(fingerprint, *entry)
+            # (Already reported while rendering, so splicing it in below only needs to write it)
+            entry = entry[:2] + ([],)
+        with qa_notes_profile_phase(self.profiler, 'splice'):
+            uid_count, html, blob_fallbacks = entry
+            f.write_body(qa_notes_resolve_uid_tokens(html, self._next_elem_uid))
+            self._next_elem_uid = self._next_elem_uid + uid_count
+            for fallback_key, fallback in blob_fallbacks:
+                self._report_fallback(fallback_key, QANotesBlobFallback(**fallback))
+
+    def get_build_time(self, cmc):
+        '''
+        Returns the build time to show on the page: ``self.build_time`` if set, else the ``build-time`` field of the
+        query output if present, else the ``SOURCE_DATE_EPOCH`` environment variable if set, else the current time
+        (unless ``self.deterministic`` is set, in which case that's an error).
+
+        Raises ``QANotesBuildTimeError`` if there is no usable build time.
+        '''
+        if self.build_time is not None:
+            return self.build_time
+        try:
+            if cmc.everything.get('build-time') is not None:
+                return qa_notes_parse_build_time(cmc.everything['build-time'])
+            if os.environ.get('SOURCE_DATE_EPOCH'):
+                return qa_notes_parse_build_time(os.environ['SOURCE_DATE_EPOCH'])
+        except ValueError as e:
+            raise QANotesBuildTimeError(str(e)) from e
+        if self.deterministic:
+            raise QANotesBuildTimeError('A deterministic build needs a build time; set the build-time field of the query output, '
+                             'or the SOURCE_DATE_EPOCH environment variable, or use --build-time')
+        return datetime.datetime.today()
+
+    def write_release(self, f, index, cmc, is_first_release):
+        with qa_notes_profile_phase(self.profiler, 'release_head'):
+            release_div_id = self.write_release_head(f, index.release, cmc, is_first_release)
+        self.write_release_body(f, index, is_first_release, release_div_id)
 
     def write_release_head(self, f, release, cmc, is_first_release):
         release_div_id = self._get_elem_uid()
         f.write_body('<div class="release-head"><span class="release-name">Changes in ')
         f.write_body(escape(release['name']))
         f.write_body('</span><span class="release-since">(since ')
-        bag = [x['name'] for x in release['after']]
-        bag = seano_minimum_descendant_list(bag, cmc)
-        f.write_body(escape(' and '.join(bag) or 'the dawn of time'))
+        f.write_body(escape(self.get_release_since(release, cmc)))
         f.write_body(')</span>')
-        f.write_body('<span class="show-release" id="show-release-%d" style="display:%s">' \
-                     '''<a href="javascript:showRelease('%d')">Show</a></span>''' % (
-                         release_div_id, 'inline-block' if not is_first_release else 'none', release_div_id))
-        f.write_body('<span class="hide-release" id="hide-release-%d" style="display:%s">' \
-                     '''<a href="javascript:hideRelease('%d')">Hide</a></span>''' % (
-                         release_div_id, 'none' if not is_first_release else 'inline-block', release_div_id))
+        f.write_body('<span class="show-release" id="show-release-%s" style="display:%s">%s</span>' % (
+                         release_div_id, 'inline-block' if not is_first_release else 'none',
+                         self.render_js_link('showRelease', release_div_id, 'Show')))
+        f.write_body('<span class="hide-release" id="hide-release-%s" style="display:%s">%s</span>' % (
+                         release_div_id, 'none' if not is_first_release else 'inline-block',
+                         self.render_js_link('hideRelease', release_div_id, 'Hide')))
         f.write_body('</div>') # end of "release-head" div
         return release_div_id
 
-    def write_release_body(self, f, release, is_first_release, release_body_div_id):
-        f.write_body('<div id="release-body-%d" class="release-body" style="display:%s">' % (
+    def write_release_body(self, f, index, is_first_release, release_body_div_id):
+        f.write_body('<div id="release-body-%s" class="release-body" style="display:%s">' % (
                          release_body_div_id, 'none' if not is_first_release else 'block'))
-        release_notes_id, qa_notes_id = self.write_release_section_toggles(f)
-        self.write_release_notes(f, release, release_notes_id)
-        self.write_qa_notes(f, release, qa_notes_id)
+        if self.lazy and not is_first_release:
+            # Keep the body out of the DOM (until showRelease() puts it there) by embedding it as-is in a template
+            # element, whose contents browsers parse, but don't render, run, or load anything from:
+            f.write_body('</div><template id="release-data-%s">' % (release_body_div_id,))
+            self.write_release_body_contents(f, index)
+            f.write_body('</template>')
+            return
+        self.write_release_body_contents(f, index)
         f.write_body('</div>')
 
+    def write_release_body_contents(self, f, index):
+        with qa_notes_profile_phase(self.profiler, 'section_toggles'):
+            release_notes_id, qa_notes_id = self.write_release_section_toggles(f)
+        with qa_notes_profile_phase(self.profiler, 'release_notes'):
+            self.write_release_notes(f, index, release_notes_id)
+        with qa_notes_profile_phase(self.profiler, 'qa_notes'):
+            self.write_qa_notes(f, index, qa_notes_id)
+
     def write_release_section_toggles(self, f):
         release_notes_id = self._get_elem_uid()
         qa_notes_id = self._get_elem_uid()
         f.write_body('<div class="release-subhead">')
-        f.write_body('<span class="show-release-notes" id="show-release-notes-%d" style="display:inline-block">' \
-                     '''<a href="javascript:showReleaseNotes('%d')">Release Notes</a></span>''' % (
-                         release_notes_id, release_notes_id))
-        f.write_body('<span class="hide-release-notes" id="hide-release-notes-%d" style="display:none">' \
-                     '''<a href="javascript:hideReleaseNotes('%d')">Release Notes</a></span>''' % (
-                         release_notes_id, release_notes_id))
-        f.write_body('<span class="show-qa-notes" id="show-qa-notes-%d" style="display:none">' \
-                     '''<a href="javascript:showQaNotes('%d')">QA Notes</a></span>''' % (
-                         qa_notes_id, qa_notes_id))
-        f.write_body('<span class="hide-qa-notes" id="hide-qa-notes-%d" style="display:inline-block">' \
-                     '''<a href="javascript:hideQaNotes('%d')">QA Notes</a></span>''' % (
-                         qa_notes_id, qa_notes_id))
+        f.write_body('<span class="show-release-notes" id="show-release-notes-%s" style="display:inline-block">%s</span>' % (
+                         release_notes_id, self.render_js_link('showReleaseNotes', release_notes_id, 'Release Notes')))
+        f.write_body('<span class="hide-release-notes" id="hide-release-notes-%s" style="display:none">%s</span>' % (
+                         release_notes_id, self.render_js_link('hideReleaseNotes', release_notes_id, 'Release Notes')))
+        f.write_body('<span class="show-qa-notes" id="show-qa-notes-%s" style="display:none">%s</span>' % (
+                         qa_notes_id, self.render_js_link('showQaNotes', qa_notes_id, 'QA Notes')))
+        f.write_body('<span class="hide-qa-notes" id="hide-qa-notes-%s" style="display:inline-block">%s</span>' % (
+                         qa_notes_id, self.render_js_link('hideQaNotes', qa_notes_id, 'QA Notes')))
         f.write_body('</div>') # end of "release-subhead" div
         return release_notes_id, qa_notes_id
 
-    def write_release_notes(self, f, release, release_notes_id): #pylint: disable=R0201
-        def render_mouse_hover_toggle_logic(identifiers):
-            # Here, we expect that we are within the attribute list of the start of an HTML element of some kind.
-            # Here, we add the class, onmouseover, and onmouseleave elements.
-            # The caller is expected to close this element (i.e., write the '>')
-            return ''.join([
-                ' class="',
-                ' '.join(identifiers),
-                '" onmouseover="',
-                ';'.join(['''Array.prototype.forEach.call(document.getElementsByClassName('%s'), function(e){e.classList.toggle('rnhover', true)})''' % (s,) for s in identifiers]), #pylint: disable=C0301
-                '" onmouseleave="',
-                ';'.join(['''Array.prototype.forEach.call(document.getElementsByClassName('%s'), function(e){e.classList.toggle('rnhover', false)})''' % (s,) for s in identifiers]), #pylint: disable=C0301
-                '"',
-            ])
-
+    def write_release_notes(self, f, index, release_notes_id):
+        from .shared.components import seano_render_html_hlist #pylint: disable=C0415
         def write_hlist(hlist, default, is_blob_field=False, include_tickets=False):
             if not hlist:
                 f.write_body(default)
                 return
+            base_func = index.line_formatter_text_with_tickets(line_formatter=self.hlist_line_formatter,
+                                                               ticket_formatter=self.render_html_ticket) \
+                if include_tickets else self.hlist_line_formatter
             def block_formatter(node):
-                base_func = seano_html_hlist_blob_formatter_simple
-                result = base_func(node=node)
-                styles = ['r%dp%s' % (release_notes_id, id) for id in node.note_ids]
-                return '<div' + render_mouse_hover_toggle_logic(styles) + '>' + result + '</div>'
+                result = self.hlist_block_formatter(node=node)
+                styles = self.get_hover_classes(release_notes_id, node.note_ids)
+                return '<div' + self.render_mouse_hover_toggle_logic(styles) + '>' + result + '</div>'
             def line_formatter(node):
-                base_func = seano_html_hlist_line_formatter_text_with_tickets(notes=release.get('notes') or []) if include_tickets \
-                    else seano_html_hlist_line_formatter_simple
                 result = base_func(node=node)
-                styles = ['r%dp%s' % (release_notes_id, id) for id in node.element.tags]
-                return '<span' + render_mouse_hover_toggle_logic(styles) + '>' + result + '</span>'
+                styles = self.get_hover_classes(release_notes_id, node.element.tags)
+                return '<span' + self.render_mouse_hover_toggle_logic(styles) + '>' + result + '</span>'
             f.write_body(seano_render_html_hlist(hlist, is_blob_field=is_blob_field, block_formatter=block_formatter, line_formatter=line_formatter))
-        f.write_body('<div id="release-notes-%d" class="release-notes-body" style="display:none">' %(release_notes_id,))
+        f.write_body('<div id="release-notes-%s" class="release-notes-body" style="display:none">' %(release_notes_id,))
         f.write_body('<div class="public-release-notes">')
         backstory_clarification = ''
-        if any([x.get('is-copied-from-backstory') for x in release.get('notes') or []]):
+        if index.includes_backstories:
             backstory_clarification = ' <span class="clarification">(includes backstories)</span>'
         f.write_body('<h4>Public Release Notes' + backstory_clarification + '</h4>')
-        write_hlist(hlist=seano_read_hlist(notes=release.get('notes') or [],
-                                          keys=['customer-short-loc-hlist-md', 'customer-short-loc-hlist-rst'],
-                                          localizations=['en-US']),
+        write_hlist(hlist=index.public_short,
                     default='<p><em>No public release notes</em></p>')
         f.write_body('</div>')
         f.write_body('<div class="internal-release-notes">')
         f.write_body('<h4>Internal Release Notes</h4>')
-        write_hlist(hlist=seano_read_hlist(notes=[x for x in release.get('notes') or [] if not x.get('is-copied-from-backstory')],
-                                          keys=['employee-short-loc-hlist-md', 'employee-short-loc-hlist-rst'],
-                                          localizations=['en-US']),
+        write_hlist(hlist=index.internal_short,
                     default='<p><em>No internal release notes</em></p>',
                     include_tickets=True)
         f.write_body('</div>')
         f.write_body('<div class="custsrv-release-notes">')
         f.write_body('<h4>Member Care Notes</h4>')
-        write_hlist(hlist=seano_read_hlist(notes=[x for x in release.get('notes') or [] if not x.get('is-copied-from-backstory')],
-                                          keys=['mc-technical-loc-md', 'mc-technical-loc-rst'],
-                                          localizations=['en-US']),
+        write_hlist(hlist=index.member_care,
                     is_blob_field=True,
                     default='<p><em>No Member Care notes</em></p>')
         f.write_body('</div>')
         f.write_body('</div>')
 
-    def write_qa_notes(self, f, release, qa_notes_id):
-        f.write_body('<div id="qa-notes-%d">' % (qa_notes_id,))
-        notes_new_in_this_release = [x for x in release['notes'] if not x.get('is-copied-from-backstory')]
-        if not release['notes']:
+    def write_qa_notes(self, f, index, qa_notes_id):
+        from .shared.components import seano_render_html_hlist #pylint: disable=C0415
+        f.write_body('<div id="qa-notes-%s">' % (qa_notes_id,))
+        if not index.notes:
             f.write_body('<p class="testing"><em>No changes</em></p>')
-        elif not notes_new_in_this_release:
+        elif not index.new_notes:
             f.write_body('<p class="testing"><em>No changes, however some release notes were repeated '
                          'from earlier work</em></p>')
         else:
             f.write_body('<ul>')
-            for note in notes_new_in_this_release:
+            for note in index.new_notes:
+                note_start = time.perf_counter()
                 f.write_body('<li><span class="note-head"><span class="internal-short">')
-                head = seano_read_hlist([note], ['employee-short-loc-hlist-md', 'employee-short-loc-hlist-rst'], ['en-US']).first()
-                f.write_body(head.toHtmlLine().html or 'Internal release note missing')
+                head = note.internal_short.first()
+                f.write_body(self.render_html_line(head).html or 'Internal release note missing')
                 f.write_body('</span>') # employee-short-loc-hlist-*
-                for t in note.get('tickets', None) or [None]: # None is used to indicate secret work
+                tickets_start = time.perf_counter()
+                for t in note.note.get('tickets', None) or [None]: # None is used to indicate secret work
                     f.write_body('<span class="ticket">')
                     f.write_body(self.compile_ticket_url(t))
                     f.write_body('</span>')
-                technical = seano_read_hlist([note], ['employee-technical-loc-md', 'employee-technical-loc-rst'], ['en-US'])
+                if self.profiler is not None:
+                    self.profiler.add_activity_time('tickets', time.perf_counter() - tickets_start)
+                technical = note.internal_technical
                 if technical:
                     tech_id = self._get_elem_uid()
-                    f.write_body('<span class="ticket show-technical" id="show-technical-%d">' \
-                                 '''<a href="javascript:showTechnical('%d')">More details</a></span>''' % (
-                                     tech_id, tech_id))
-                    f.write_body('<span class="ticket hide-technical" id="hide-technical-%d" style="display:none">' \
-                                 '''<a href="javascript:hideTechnical('%d')">Fewer details</a></span>''' % (
-                                     tech_id, tech_id))
+                    f.write_body('<span class="ticket show-technical" id="show-technical-%s">%s</span>' % (
+                                     tech_id, self.render_js_link('showTechnical', tech_id, 'More details')))
+                    f.write_body('<span class="ticket hide-technical" id="hide-technical-%s" style="display:none">%s</span>' % (
+                                     tech_id, self.render_js_link('hideTechnical', tech_id, 'Fewer details')))
                 f.write_body('</span>') # note-head
                 if technical:
-                    f.write_body('<div class="technical" id="technical-%d" style="display:none">' % (tech_id,))
-                    f.write_body(seano_render_html_hlist(technical, is_blob_field=True))
+                    f.write_body('<div class="technical" id="technical-%s" style="display:none">' % (tech_id,))
+                    f.write_body(seano_render_html_hlist(technical, is_blob_field=True,
+                                                         block_formatter=self.hlist_block_formatter,
+                                                         line_formatter=self.hlist_line_formatter))
                     f.write_body('</div>')
                 f.write_body('<div class="testing">')
-                f.write_body(seano_render_html_hlist(seano_read_hlist([note], ['qa-technical-loc-md', 'qa-technical-loc-rst'], ['en-US']), is_blob_field=True)
-                             or SeanoMarkdown('*QA Notes missing*').toHtmlBlock().html)
+                f.write_body(seano_render_html_hlist(note.qa, is_blob_field=True,
+                                                     block_formatter=self.hlist_block_formatter,
+                                                     line_formatter=self.hlist_line_formatter)
+                             or self.render_constant_html_block(_QA_NOTES_MISSING_MD))
                 f.write_body('</div></li>')
+                if self.profiler is not None:
+                    self.profiler.add_note_time(note.note.get('id'), index.release['name'],
+                                                time.perf_counter() - note_start)
             f.write_body('</ul>')
         f.write_body('</div>')
 
 
+class QANotesRenderStats(object):
+    '''
+    Timing and size information about one rendering of the QA Notes page, as returned by ``compile_qa_notes()``:
+
+    - ``load_seconds``: time spent preparing the ``SeanoMetaCache`` (near zero when one is given)
+    - ``render_seconds``: time spent rendering the page and writing it to the output stream
+    - ``total_seconds``: the sum of the above
+    - ``release_count``: the number of releases rendered
+    - ``note_count``: the number of notes in the rendered releases
+    - ``output_bytes``: the size of the page, when encoded as UTF-8
+    - ``blob_fallbacks``: the markup blobs that were shown as plain text because they were over budget (a list of
+      ``QANotesBlobFallback``)
+    '''
+    def __init__(self):
+        self.load_seconds = 0.0
+        self.render_seconds = 0.0
+        self.release_count = 0
+        self.note_count = 0
+        self.output_bytes = 0
+        self.blob_fallbacks = []
+
+    @property
+    def total_seconds(self):
+        return self.load_seconds + self.render_seconds
+
+    def as_dict(self):
+        return {
+            'load_seconds': self.load_seconds,
+            'render_seconds': self.render_seconds,
+            'total_seconds': self.total_seconds,
+            'release_count': self.release_count,
+            'note_count': self.note_count,
+            'output_bytes': self.output_bytes,
+            'blob_fallbacks': [x.as_dict() for x in self.blob_fallbacks],
+        }
+
+
+class _ByteCountingStream(object):
+    '''
+    Forwards writes to a text stream, keeping track of how many bytes the written text is when encoded as UTF-8.
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+        self.byte_count = 0
+
+    def write(self, txt):
+        self.byte_count = self.byte_count + len(txt.encode('utf-8'))
+        return self.stream.write(txt)
+
+
+def compile_qa_notes(query, out, fragment_cache=None, jobs=1, compact=False, profiler=None, manifest=None,
+                     release_count=DEFAULT_RELEASE_COUNT, lazy=False, build_time=None, deterministic=False,
+                     locale=DEFAULT_LOCALE, blob_max_bytes=None, blob_max_seconds=None):
+    '''
+    Renders the QA Notes page for the given seano query, writing it to ``out`` (a writable text stream) one release
+    at a time, and returns a ``QANotesRenderStats`` describing the render.
+
+    ``query`` is the seano query output, either as an already-deserialized dictionary, or as a ``SeanoMetaCache``.
+
+    This is the fast path for embedding the QA Notes view in another Python program (such as seano itself): unlike
+    ``format_qa_notes()``, which accepts only serialized Json, the query is used as-is, so the cost of serializing
+    it to Json and parsing it back again is skipped entirely.  The given query is not modified.
+
+    If a ``QANotesProfiler`` is given, a detailed breakdown of where the time went is recorded in it.  If a
+    ``QANotesReleaseManifest`` is given, unchanged releases are re-used from it; call its ``save()`` afterwards.
+
+    ``release_count`` is the number of releases to show; with ``lazy``, the bodies of all releases but the first are
+    only inserted into the page's DOM when they are first shown, so that large values of ``release_count`` don't
+    slow down opening the page.
+
+    ``build_time`` (a ``datetime.datetime``) is the build time to show on the page; see
+    ``QANotesRenderInfrastructure.get_build_time()`` for where it comes from when not given, and what
+    ``deterministic`` does.
+
+    ``locale`` is the locale to write the page in; text missing in that locale is written in ``DEFAULT_LOCALE``.
+    To render the page in several locales, pass the same ``SeanoMetaCache`` each time, so that the release ancestry
+    graph is indexed only once.
+
+    Markup blobs larger than ``blob_max_bytes`` (or that take longer than ``blob_max_seconds`` to render, when that
+    can be enforced; see ``QANotesBlobBudget``) are shown as plain text instead, and listed in the returned stats.
+    '''
+    stats = QANotesRenderStats()
+    start = time.time()
+    cmc = query if isinstance(query, SeanoMetaCache) else QANotesMetaCache(query)
+    stats.load_seconds = time.time() - start
+
+    infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache, jobs=jobs, compact=compact,
+                                                 profiler=profiler, manifest=manifest, release_count=release_count,
+                                                 lazy=lazy, build_time=build_time, deterministic=deterministic,
+                                                 locale=locale, blob_max_bytes=blob_max_bytes,
+                                                 blob_max_seconds=blob_max_seconds)
+    counter = _ByteCountingStream(out)
+    start = time.time()
+    infrastructure.run(cmc, out=counter)
+    stats.render_seconds = time.time() - start
+
+    rendered = cmc.releases[:infrastructure.release_count]
+    stats.release_count = len(rendered)
+    stats.note_count = sum([len(x.get('notes') or []) for x in rendered])
+    stats.output_bytes = counter.byte_count
+    stats.blob_fallbacks = infrastructure.blob_fallbacks
+    return stats
+
+
 def format_qa_notes(*args):
     '''
     Given a Json blob (in serialized form), return the contents of the corresponding QA Notes page.
@@ -465,19 +1140,319 @@ def format_qa_notes(*args):
     parser.prog = ' '.join([parser.prog, 'format', 'qa_notes'])
     parser.add_argument('--src', action='store', default='-', help='Input file; use a single hyphen for stdin; default is to use stdin')
     parser.add_argument('--out', action='store', default='-', help='Output file; use a single hyphen for stdout; default is to use stdout')
+    parser.add_argument('--batch', action='store', default=None,
+                        help='Render many pages in one process, as listed in this Json file (a list of objects with "src", "out", and optionally "manifest" file names, relative to the Json file); can not be used with --src, --out, or --manifest')
+    parser.add_argument('--cache-dir', action='store', default=None, help='Directory in which to cache rendered markup between runs; default is to not cache')
+    parser.add_argument('--cache-max-bytes', action='store', type=int, default=DEFAULT_FRAGMENT_CACHE_MAX_BYTES,
+                        help='Size limit of the cache directory, after which the least recently used entries are evicted; default is %(default)s')
+    parser.add_argument('--jobs', action='store', type=int, default=1,
+                        help='Number of worker processes to render markup with (with --batch, to render pages with); default is %(default)s (render serially)')
+    parser.add_argument('--releases', action='store', type=int, default=DEFAULT_RELEASE_COUNT,
+                        help='Number of the most recent releases to show; default is %(default)s')
+    parser.add_argument('--lazy', action='store_true',
+                        help='Only insert the bodies of releases other than the newest into the page when they are shown (keeps large --releases values fast to open)')
+    parser.add_argument('--locales', action='store', default=None,
+                        help='Comma-separated list of locales to render one page each in (from a single read of the query, in parallel with --jobs); OUT (and --manifest) may contain {locale}, else the locale is added before the file extension; default is to render one page in %s' % (DEFAULT_LOCALE,))
+    parser.add_argument('--blob-max-bytes', action='store', type=int, default=None,
+                        help='Show markup blobs larger than this many bytes as (truncated) plain text instead of rendering them; default is no limit')
+    parser.add_argument('--blob-max-seconds', action='store', type=float, default=None,
+                        help='Show markup blobs that take longer than this to render as plain text instead (only enforced where a timer signal can interrupt rendering: on the main thread, and not on Windows); default is no limit')
+    parser.add_argument('--compact', action='store_true',
+                        help='Minimize the size of the output (delegated JS event handlers, minified CSS & JS, short class names)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write the output one release at a time as it is rendered, rather than all at once at the end')
+    parser.add_argument('--build-time', action='store', default=None,
+                        help='Build time to show on the page, in seconds since the Unix epoch or as an ISO 8601 date and time; default is the build-time field of the query output, else $SOURCE_DATE_EPOCH, else now')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='Fail rather than show the current time on the page when no build time is given, so that the same query always produces the same page')
+    parser.add_argument('--hash', action='store_true', help='Also write the SHA-256 hash of the page to OUT.sha256')
+    parser.add_argument('--gzip', action='store_true', help='Also write a (reproducible) gzip-compressed copy of the page to OUT.gz')
+    parser.add_argument('--brotli', action='store_true', help='Also write a Brotli-compressed copy of the page to OUT.br (requires the brotli package)')
+    parser.add_argument('--manifest', action='store', default=None,
+                        help='Sidecar file in which to remember rendered releases, so that releases that did not change since the last build are re-used as-is; default is to render every release')
+    parser.add_argument('--profile', action='store', default=None,
+                        help='Save a Json report of where the time went (per phase, per release, per note) to this file')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record peak memory use in the --profile report (slows down rendering considerably)')
+    parser.add_argument('--serve', action='store', default=None, metavar='[HOST:]PORT',
+                        help='Instead of writing the page to OUT, serve it over HTTP on this port (of localhost, unless a host is given), re-rendering it whenever the query file (or the --watch paths) change; served pages reload themselves when they change')
+    parser.add_argument('--watch', action='append', default=None,
+                        help='With --serve, re-render when any file in this file or directory (such as the seano database) changes; may be given more than once; default is to watch the query file')
+    parser.add_argument('--query-command', action='store', default=None,
+                        help='With --serve, read the query output from the standard output of this shell command (such as "seano query") instead of --src, running it again on every change')
 
     ns = parser.parse_args(args)
+    if ns.releases < 1:
+        parser.error('--releases must be at least 1')
+    if ns.batch and (ns.src not in ['-'] or ns.out not in ['-'] or ns.manifest):
+        # (The batch file names the files of every page, so these would be silently ignored)
+        parser.error('--batch can not be used with --src, --out, or --manifest')
+    if (ns.blob_max_bytes is not None and ns.blob_max_bytes < 0) \
+            or (ns.blob_max_seconds is not None and ns.blob_max_seconds <= 0):
+        parser.error('--blob-max-bytes and --blob-max-seconds must be positive')
+    if ns.locales is not None:
+        ns.locales = [x.strip() for x in ns.locales.split(',') if x.strip()]
+        if not ns.locales:
+            parser.error('--locales must list at least one locale')
+        if not ns.batch and ns.serve is None and ns.out in ['-'] and len(ns.locales) > 1:
+            parser.error('--locales with more than one locale requires an output file')
+    if ns.build_time is not None:
+        try:
+            ns.build_time = qa_notes_parse_build_time(ns.build_time)
+        except ValueError as e:
+            parser.error(str(e))
+    if ns.serve is None and (ns.watch or ns.query_command):
+        parser.error('--watch and --query-command require --serve')
+    if ns.serve is not None:
+        host, _, port = ns.serve.rpartition(':')
+        if not port.isdigit():
+            parser.error('--serve expects a port number, optionally preceded by a host name and a colon')
+        ns.serve = (host or 'localhost', int(port))
+        if ns.batch or ns.profile or (ns.locales and len(ns.locales) > 1):
+            parser.error('--serve can not be used with --batch, --profile, or more than one locale')
+        if ns.out not in ['-'] or ns.manifest or ns.hash or ns.gzip or ns.brotli or ns.stream:
+            # (The page is only ever served, so these would be silently ignored)
+            parser.error('--serve can not be used with --out, --manifest, --hash, --gzip, --brotli, or --stream')
+        if ns.query_command and not ns.watch:
+            parser.error('--query-command requires --watch, to know when to run it again')
+        if not ns.query_command and ns.src in ['-']:
+            parser.error('--serve requires a query file (--src) or a --query-command')
+    if (ns.hash or ns.gzip or ns.brotli) and not ns.batch and ns.out in ['-']:
+        parser.error('--hash, --gzip, and --brotli require an output file')
+    if ns.brotli and qa_notes_import_brotli() is None:
+        parser.error('--brotli requires the brotli package (pip install brotli)')
+    if ns.batch and ns.profile and ns.jobs > 1:
+        parser.error('--profile can not be used with --batch and --jobs')
+    if ns.locales and len(ns.locales) > 1 and ns.profile and ns.jobs > 1:
+        parser.error('--profile can not be used with --locales and --jobs')
+
+    if ns.serve is not None:
+        _serve_qa_notes(ns)
+        return
+
+    try:
+        if not ns.profile:
+            _format_qa_notes(ns, profiler=None)
+            return
+        with QANotesProfiler(trace_memory=ns.profile_memory) as profiler:
+            _format_qa_notes(ns, profiler=profiler)
+    except QANotesBuildTimeError as e:
+        parser.error(str(e)) # (Nothing of the page has been written)
+    profiler.save(ns.profile)
 
-    if ns.src in ['-']:
-        data = sys.stdin.read()
+
+def _format_qa_notes(ns, profiler):
+    fragment_cache = None
+    if ns.cache_dir:
+        fragment_cache = QANotesFragmentCache(ns.cache_dir, max_bytes=ns.cache_max_bytes)
+
+    if ns.batch:
+        _format_qa_notes_batch(ns, fragment_cache, profiler)
+    elif ns.locales and len(ns.locales) > 1 and ns.jobs > 1:
+        _format_qa_notes_locales(ns)
     else:
-        with open(ns.src, 'r') as f:
-            data = f.read()
+        infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache, jobs=ns.jobs, profiler=profiler,
+                                                     **_infrastructure_options(ns))
+        _render_qa_notes_file(infrastructure, src=ns.src, out=ns.out, manifest=ns.manifest, locales=ns.locales,
+                              **_output_options(ns))
+
+    if fragment_cache is not None:
+        with qa_notes_profile_phase(profiler, 'cache_trim'):
+            fragment_cache.trim()
+
 
-    result = QANotesRenderInfrastructure().run(data)
+def _serve_qa_notes(ns):
+    from .serve import QANotesLiveServer #pylint: disable=C0415
+    fragment_cache = None
+    if ns.cache_dir:
+        fragment_cache = QANotesFragmentCache(ns.cache_dir, max_bytes=ns.cache_max_bytes)
+    # (This infrastructure lives until the server is stopped, so its memos are bounded)
+    infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache, jobs=ns.jobs,
+                                                 memo_max_entries=DEFAULT_MEMO_MAX_ENTRIES,
+                                                 **_infrastructure_options(ns))
+    if ns.locales:
+        infrastructure.locale = ns.locales[0]
+    server = QANotesLiveServer(infrastructure, src=ns.src, query_command=ns.query_command, watch_paths=ns.watch)
+    server.serve_forever(*ns.serve)
+
+
+def _infrastructure_options(ns):
+    # Options that affect the content of the rendered page (as opposed to how it's rendered):
+    return {'compact': ns.compact, 'release_count': ns.releases, 'lazy': ns.lazy, 'build_time': ns.build_time,
+            'deterministic': ns.deterministic, 'blob_max_bytes': ns.blob_max_bytes,
+            'blob_max_seconds': ns.blob_max_seconds}
+
+
+def _output_options(ns):
+    return {'stream': ns.stream, 'content_hash': ns.hash, 'gzip_copy': ns.gzip, 'brotli_copy': ns.brotli}
+
+
+def _localized_path(path, locale):
+    '''
+    Returns the file name of the page (or manifest) for the given locale: ``{locale}`` in the given file name is
+    replaced with the locale if present, else the locale is added before the file extension.
+    '''
+    if path in ['-']:
+        return path
+    if '{locale}' in path:
+        return path.replace('{locale}', locale)
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, locale, ext)
 
-    if ns.out in ['-']:
-        sys.stdout.write(result)
+
+def _read_query_file(src, release_count, profiler):
+    # Only the releases that will actually be shown are read in full:
+    with qa_notes_profile_phase(profiler, 'load'):
+        if src in ['-']:
+            return qa_notes_read_query(sys.stdin, release_count=release_count)
+        with open(src, 'r') as f:
+            return qa_notes_read_query(f, release_count=release_count)
+
+
+def _render_qa_notes_file(infrastructure, src, out, manifest, locales=None, **output_options):
+    data = _read_query_file(src, infrastructure.release_count, infrastructure.profiler)
+    if locales is None:
+        _write_qa_notes_page(infrastructure, data, out=out, manifest=manifest, **output_options)
+        return
+    # One page per locale, all rendered from the same query (and with the same infrastructure, so that the ancestry
+    # index, tickets, and rendered markup are shared between them):
+    default_locale = infrastructure.locale
+    try:
+        for locale in locales:
+            infrastructure.locale = locale
+            _write_qa_notes_page(infrastructure, data, out=_localized_path(out, locale),
+                                 manifest=_localized_path(manifest, locale) if manifest else None, **output_options)
+    finally:
+        infrastructure.locale = default_locale
+
+
+def _write_qa_notes_page(infrastructure, data, out, manifest, stream=False, content_hash=False, gzip_copy=False,
+                         brotli_copy=False):
+    infrastructure.manifest = QANotesReleaseManifest(manifest) if manifest else None
+
+    if not stream:
+        result = infrastructure.run(data)
+        with qa_notes_profile_phase(infrastructure.profiler, 'write'):
+            if out in ['-']:
+                sys.stdout.write(result)
+            else:
+                with open(out, 'w') as f:
+                    f.write(result)
+    elif out in ['-']:
+        infrastructure.run(data, out=sys.stdout)
     else:
-        with open(ns.out, 'w') as f:
-            f.write(result)
+        # Stream into a temporary file next to the real one, so that a failed render doesn't leave a truncated
+        # page behind in place of the last good one:
+        tmp_out = out + '.tmp'
+        try:
+            with open(tmp_out, 'w') as f:
+                infrastructure.run(data, out=f)
+            os.replace(tmp_out, out)
+        finally:
+            if os.path.exists(tmp_out):
+                os.remove(tmp_out)
+
+    qa_notes_report_blob_fallbacks(infrastructure.blob_fallbacks, sys.stderr, page='<stdout>' if out in ['-'] else out)
+
+    if out not in ['-']:
+        qa_notes_write_page_artifacts(out, content_hash=content_hash, gzip_copy=gzip_copy, brotli_copy=brotli_copy)
+
+    if infrastructure.manifest is not None:
+        infrastructure.manifest.save()
+        infrastructure.manifest = None
+
+
+# With --locales and --jobs, each worker process reads the query once (see _init_locale_worker()), and renders its
+# share of the locales with one infrastructure.
+_locale_worker = None
+
+
+def _init_locale_worker(options, everything):
+    '''
+    Process pool initializer used by ``--locales`` with ``--jobs``: receives the already-read query once per worker.
+    '''
+    global _locale_worker #pylint: disable=W0603
+    cache_dir, cache_max_bytes, infrastructure_options, output_options = options
+    fragment_cache = QANotesFragmentCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+    infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache, **infrastructure_options)
+    _locale_worker = (infrastructure, QANotesMetaCache(everything), output_options)
+
+
+def _render_locale_in_worker(page):
+    '''
+    Process pool entry point used by ``--locales`` with ``--jobs``: renders the page for a single locale.
+    '''
+    infrastructure, cmc, output_options = _locale_worker
+    locale, out, manifest = page
+    infrastructure.locale = locale
+    _write_qa_notes_page(infrastructure, cmc, out=out, manifest=manifest, **output_options)
+
+
+def _format_qa_notes_locales(ns):
+    cmc = _read_query_file(ns.src, ns.releases, profiler=None)
+    pages = [(locale, _localized_path(ns.out, locale), _localized_path(ns.manifest, locale) if ns.manifest else None)
+             for locale in ns.locales]
+    import concurrent.futures #pylint: disable=C0415
+    options = (ns.cache_dir, ns.cache_max_bytes, _infrastructure_options(ns), _output_options(ns))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(ns.jobs, len(pages)), initializer=_init_locale_worker,
+                                                initargs=(options, cmc.everything)) as pool:
+        # Consume the results, to raise the first error (if any):
+        list(pool.map(_render_locale_in_worker, pages))
+
+
+def _read_batch_file(path):
+    '''
+    Reads a ``--batch`` file: a Json list of objects, each with ``src`` and ``out`` keys (and optionally a
+    ``manifest`` key), naming files relative to the directory containing the batch file.
+    '''
+    with open(path, 'r') as f:
+        items = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    result = []
+    for item in items if isinstance(items, list) else [items]:
+        if not isinstance(item, dict) or not isinstance(item.get('src'), str) or not isinstance(item.get('out'), str):
+            raise ValueError('%s: every item must be an object with "src" and "out" file names; found %r' % (
+                path, item))
+        result.append({
+            'src': os.path.join(base, item['src']),
+            'out': os.path.join(base, item['out']),
+            'manifest': os.path.join(base, item['manifest']) if item.get('manifest') else None,
+        })
+    return result
+
+
+# In batch mode with --jobs, each worker process renders its share of the pages with one infrastructure, so that
+# warmed-up markup engines and rendered markup are shared across all of the pages it renders.
+_batch_worker_infrastructure = None
+
+
+def _render_batch_item_in_worker(options, item):
+    '''
+    Process pool entry point used by ``--batch`` with ``--jobs``: renders a single QA Notes page.
+    '''
+    global _batch_worker_infrastructure #pylint: disable=W0603
+    cache_dir, cache_max_bytes, infrastructure_options, output_options, locales = options
+    if _batch_worker_infrastructure is None:
+        fragment_cache = QANotesFragmentCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+        _batch_worker_infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache,
+                                                                   **infrastructure_options)
+    _render_qa_notes_file(_batch_worker_infrastructure, src=item['src'], out=item['out'], manifest=item['manifest'],
+                          locales=locales, **output_options)
+
+
+def _format_qa_notes_batch(ns, fragment_cache, profiler):
+    items = _read_batch_file(ns.batch)
+    if ns.jobs <= 1 or len(items) <= 1:
+        # One infrastructure for all pages, so that each distinct markup blob is rendered only once:
+        infrastructure = QANotesRenderInfrastructure(fragment_cache=fragment_cache, profiler=profiler,
+                                                     **_infrastructure_options(ns))
+        for item in items:
+            _render_qa_notes_file(infrastructure, src=item['src'], out=item['out'], manifest=item['manifest'],
+                                  locales=ns.locales, **_output_options(ns))
+        return
+    import concurrent.futures #pylint: disable=C0415
+    import functools #pylint: disable=C0415
+    options = (ns.cache_dir, ns.cache_max_bytes, _infrastructure_options(ns), _output_options(ns), ns.locales)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(ns.jobs, len(items))) as pool:
+        # Consume the results, to raise the first error (if any):
+        list(pool.map(functools.partial(_render_batch_item_in_worker, options), items))
@@ -0,0 +1,142 @@
+"""
+src/seano_formatter_qa_notes/query_reader.py
+
+Infrastructure to read a seano query output file without holding all of it in memory
+"""
+import json
+from .shared.metacache import SeanoMetaCache
+
+# Characters that may continue a number (the decoder stops a number early, rather than failing, when its buffer
+# ends with something like "3." or "1e")
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class QANotesMetaCache(SeanoMetaCache):
+    '''
+    A ``SeanoMetaCache`` that is initialized from already-deserialized seano query output data, rather than from a
+    serialized string.  Other than that, it is exactly a ``SeanoMetaCache``.
+    '''
+    def __init__(self, everything): #pylint: disable=W0231
+        # SeanoMetaCache.__init__() insists on deserializing a string itself; this is the rest of what it does:
+        self.everything = everything
+        self.releases = self.everything['releases']
+        self.named_releases = {release['name']: release for release in self.releases}
+
+
+class _JsonStreamReader(object):
+    '''
+    Reads a JSON document from a text stream, one token or value at a time.
+
+    Individual values are decoded by the standard library's (C-accelerated) decoder; this class only deals with
+    buffering, so that at no point does more of the document need to be in memory than the value being decoded.
+    '''
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read_more(self):
+        # Read at least as much as is already buffered, so that re-decoding a large value is amortized linear
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        data = self.stream.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+        self.buf = self.buf + data
+
+    def error(self, msg):
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def peek(self):
+        '''
+        Returns the next non-whitespace character without consuming it, or an empty string at the end of the
+        document.
+        '''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos = self.pos + 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._read_more()
+
+    def expect(self, chars):
+        '''
+        Consumes and returns the next non-whitespace character, which must be one of the given characters.
+        '''
+        c = self.peek()
+        if not c or c not in chars:
+            raise self.error('Expecting one of %r' % (chars,))
+        self.pos = self.pos + 1
+        return c
+
+    def value(self):
+        '''
+        Consumes and returns the next complete JSON value.
+        '''
+        self.peek()
+        while True:
+            try:
+                result, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._read_more()
+                continue
+            if not self.eof and isinstance(result, (int, float)) and not self.buf[end:].lstrip(_NUMBER_CHARS):
+                # A number at the end of the buffer may have been cut off; make sure it's really over
+                self._read_more()
+                continue
+            self.pos = end
+            return result
+
+
+def _read_releases(reader, release_count):
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.expect(']')
+        return
+    i = 0
+    while True:
+        release = reader.value()
+        if i >= release_count:
+            # Releases outside of the view's window are only ever consulted for their position in the ancestry
+            # graph; their notes are the bulk of their size, and are never rendered.
+            release.pop('notes', None)
+        yield release
+        i = i + 1
+        if reader.expect(',]') == ']':
+            return
+
+
+def qa_notes_read_query(stream, release_count, chunk_size=64 * 1024):
+    '''
+    Incrementally reads seano query output from the given text stream, and returns a ``SeanoMetaCache`` of it.
+
+    Only the first ``release_count`` releases are kept in full; the remaining releases are kept without their
+    notes, so that memory use doesn't grow with the full history of the project.  The ancestry graph (and all
+    other fields) are left intact, so the result may be used with the usual release ancestry plumbing.
+    '''
+    reader = _JsonStreamReader(stream, chunk_size=chunk_size)
+    everything = {}
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise reader.error('Expecting property name')
+            reader.expect(':')
+            if key == 'releases':
+                everything[key] = list(_read_releases(reader, release_count))
+            else:
+                everything[key] = reader.value()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek():
+        raise reader.error('Extra data')
+    return QANotesMetaCache(everything)
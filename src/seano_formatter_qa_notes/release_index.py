@@ -0,0 +1,154 @@
+"""
+src/seano_formatter_qa_notes/release_index.py
+
+Infrastructure to read everything the QA Notes view needs out of a single release, exactly once
+"""
+from functools import reduce
+import itertools
+from .memo import QANotesMemo
+from .shared.components import seano_html_hlist_line_formatter_simple, seano_render_html_ticket
+from .shared.hlist import seano_read_hlist, SeanoUnlocalizedHListNode
+
+
+PUBLIC_SHORT_KEYS = ['customer-short-loc-hlist-md', 'customer-short-loc-hlist-rst']
+INTERNAL_SHORT_KEYS = ['employee-short-loc-hlist-md', 'employee-short-loc-hlist-rst']
+INTERNAL_TECHNICAL_KEYS = ['employee-technical-loc-md', 'employee-technical-loc-rst']
+MEMBER_CARE_KEYS = ['mc-technical-loc-md', 'mc-technical-loc-rst']
+QA_KEYS = ['qa-technical-loc-md', 'qa-technical-loc-rst']
+
+
+def _merge_hlists(hlists):
+    # Merging per-note hlists is equivalent to having ``seano_read_hlist()`` read all of the notes at once
+    return reduce(lambda a, b: a.merge(b), hlists, SeanoUnlocalizedHListNode(element=None, children=None))
+
+
+class QANotesHListMemo(object):
+    '''
+    Remembers the parsed form of each field of each note, so that a note that appears in several releases (such as
+    a note copied from a backstory) is parsed only once.
+
+    Parsed hlists are keyed by note ID and field, and are only re-used if the raw field values are also identical,
+    so notes that share an ID but not their contents are still parsed correctly.  Parsed hlists are never mutated
+    while rendering (merging copies them), so sharing them between releases is safe.
+
+    With ``max_entries``, only that many of the most recently used parsed fields are remembered.
+    '''
+    def __init__(self, max_entries=None):
+        self.hit_count = 0
+        self.miss_count = 0
+        self._memo = QANotesMemo(max_entries)
+
+    def read(self, note, keys, localizations):
+        '''
+        Equivalent to ``seano_read_hlist([note], keys, localizations)``.
+        '''
+        raw = [note.get(x) for x in keys]
+        memo_key = (note.get('id'), tuple(keys), tuple(localizations))
+        entry = self._memo.get(memo_key)
+        if entry is not None and entry[0] == raw:
+            self.hit_count = self.hit_count + 1
+            return entry[1]
+        self.miss_count = self.miss_count + 1
+        result = seano_read_hlist([note], keys, localizations)
+        self._memo[memo_key] = (raw, result)
+        return result
+
+
+def _read_note_hlist(note, keys, localizations, hlist_memo):
+    if hlist_memo is None:
+        return seano_read_hlist([note], keys, localizations)
+    return hlist_memo.read(note, keys, localizations)
+
+
+class QANotesNoteIndex(object):
+    '''
+    The parsed fields of a single note that was new in (i.e., not copied from a backstory into) a release.
+    '''
+    def __init__(self, note, localizations, hlist_memo=None):
+        self.note = note
+        self.internal_short = _read_note_hlist(note, INTERNAL_SHORT_KEYS, localizations, hlist_memo)
+        self.internal_technical = _read_note_hlist(note, INTERNAL_TECHNICAL_KEYS, localizations, hlist_memo)
+        self.qa = _read_note_hlist(note, QA_KEYS, localizations, hlist_memo)
+
+
+class QANotesReleaseIndex(object):
+    '''
+    Everything the QA Notes view reads out of a single release.
+
+    Each section of the QA Notes page (public release notes, internal release notes, Member Care notes, and the
+    QA notes themselves) used to read the notes it needed on its own, which meant filtering the notes list over and
+    over, and parsing some fields (notably the employee-facing short notes) more than once.  This index walks the
+    notes of a release once, parsing each field of each note once, and all sections render from it.
+
+    If a ``QANotesHListMemo`` is given, parsed fields are shared with the indices of other releases as well.
+    '''
+    def __init__(self, release, localizations, hlist_memo=None):
+        self.release = release
+        self.notes = release.get('notes') or []
+        self.new_notes = []
+        public = []
+        for note in self.notes:
+            public.append(_read_note_hlist(note, PUBLIC_SHORT_KEYS, localizations, hlist_memo))
+            if not note.get('is-copied-from-backstory'):
+                self.new_notes.append(QANotesNoteIndex(note, localizations, hlist_memo))
+        self.includes_backstories = len(self.new_notes) != len(self.notes)
+        self.public_short = _merge_hlists(public)
+        self.internal_short = _merge_hlists([x.internal_short for x in self.new_notes])
+        self.member_care = _merge_hlists([_read_note_hlist(x.note, MEMBER_CARE_KEYS, localizations, hlist_memo)
+                                          for x in self.new_notes])
+
+        # Tickets, by note ID, in note order (for rendering ticket links on hlist lines):
+        self._tickets_by_note_id = {}
+        for position, note in enumerate(self.notes):
+            self._tickets_by_note_id.setdefault(note.get('id'), []).append((position, note.get('tickets') or []))
+
+    def get_tickets(self, note_ids):
+        '''
+        Returns the concatenated tickets lists of all of the notes in this release with any of the given IDs,
+        in the order that the notes appear in the release.
+        '''
+        hits = sorted(itertools.chain(*[self._tickets_by_note_id.get(x, []) for x in set(note_ids)]))
+        return list(itertools.chain(*[tickets for _, tickets in hits]))
+
+    def line_formatter_text_with_tickets(self, line_formatter=None, ticket_formatter=None):
+        '''
+        Equivalent to ``seano_html_hlist_line_formatter_text_with_tickets(notes=self.notes, ...)``, except that
+        looking up the tickets of a line doesn't require scanning every note in the release.  Tickets are rendered
+        with ``ticket_formatter`` (by default, ``seano_render_html_ticket()``).
+        '''
+        line_formatter = line_formatter or seano_html_hlist_line_formatter_simple
+        ticket_formatter = ticket_formatter or seano_render_html_ticket
+        def formatter(node):
+            result = line_formatter(node)
+
+            # To minimize UX noise, only print tickets on the first line in a note tree where that line and all
+            # sub-lines have the same ticket list.
+            if getattr(node, 'is_printed', False):
+                # One of our parents was already printed.  Bail.
+                return result
+
+            tickets = self.get_tickets(node.element.tags)
+            tickets_set = set(tickets)
+            for child in node.walk():
+                if tickets_set != set(self.get_tickets(child.note_ids)):
+                    # One of our children has a different note set than us.  Defer printing of tickets.
+                    return result
+
+            # We've decided to print tickets on this line.  Silence tickets on all sub-lines:
+            def silence(x):
+                x.is_printed = True
+                for child in x.children:
+                    silence(child)
+            silence(node)
+
+            # Remove duplicate tickets without changing sort order, and compile them into HTML:
+            seen = set()
+            deduped = []
+            for x in tickets:
+                if x not in seen:
+                    seen.add(x)
+                    deduped.append(ticket_formatter(x))
+
+            return ' '.join([result] + deduped)
+
+        return formatter
@@ -0,0 +1,154 @@
+"""
+src/seano_formatter_qa_notes/release_manifest.py
+
+Infrastructure to re-use rendered releases from the previous build of the QA Notes page
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+from .fragment_cache import _renderer_version, qa_notes_is_fragment_cacheable
+from .shared.html_buf import SeanoHtmlFragment
+
+# Bump this whenever the format of the manifest changes in a way that invalidates existing manifests.
+RELEASE_MANIFEST_FORMAT = 2
+
+# Element UIDs in a stored release are written as tokens (see ``qa_notes_uid_token()``), numbered from 1 within the
+# release, so that the release can be spliced into a page at any position.  Tokens are delimited by characters from
+# Unicode's Private Use Area, which HTML escaping leaves as-is, so they come out intact wherever a UID is written
+# (including within attribute values, and within the template elements of lazily loaded releases).  Markup passes
+# such characters through as-is too, so releases whose notes contain any are never stored (see
+# ``QANotesReleaseManifest.fingerprint()``).
+_UID_TOKEN_RE = re.compile('\ue000([0-9]+)\ue001')
+
+
+def _view_version():
+    '''
+    Returns a string that changes whenever anything that can affect the rendered form of a release changes: the
+    renderer version of the markup (see the fragment cache), and the source code of the view itself (including the
+    shared helpers it renders with, such as how tickets are named and how text is escaped).
+    '''
+    from . import blob_budget, qa_notes, release_index #pylint: disable=C0415
+    from .shared import components, hlist, html_buf, links #pylint: disable=C0415
+    hashes = []
+    for module in [qa_notes, release_index, blob_budget, components, hlist, html_buf, links]:
+        with open(module.__file__, 'rb') as f:
+            hashes.append(hashlib.sha1(f.read()).hexdigest())
+    return ' '.join([_renderer_version(), 'view=%s' % ('+'.join(hashes),)])
+
+
+def qa_notes_uid_token(relative_uid):
+    '''
+    Returns the placeholder written in place of the given element UID (relative to the first UID of a release) while
+    a release is being rendered for the manifest.
+    '''
+    return '\ue000%d\ue001' % (relative_uid,)
+
+
+def qa_notes_resolve_uid_tokens(html, base_uid):
+    '''
+    Replaces the UID placeholders in the given HTML with real element UIDs, starting after ``base_uid``.
+    '''
+    return _UID_TOKEN_RE.sub(lambda m: str(base_uid + int(m.group(1))), html)
+
+
+class QANotesReleaseManifest(object):
+    '''
+    A sidecar file that remembers the rendered form of each release on the previous build of a QA Notes page.
+
+    Between consecutive builds, usually only the newest (unreleased) release changes.  Each release is stored under a
+    fingerprint of everything its rendered form depends on (its notes, its ancestors, the view's configuration, and
+    the versions of the view and the markup renderers), so releases that haven't changed can be spliced into the
+    next page directly instead of being rendered again.
+
+    Element UIDs are stored as placeholders numbered relative to the release (see ``qa_notes_uid_token()``), and
+    remapped when the release is spliced into a page, so the page is identical to one rendered from scratch.
+
+    The manifest is read when constructed; call ``save()`` after a successful build to replace it with the releases
+    used by that build (releases that weren't used are dropped, so the manifest doesn't grow without bound).  With
+    no path, the manifest is kept only in memory, for long-lived processes that render the same page over and over.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.hit_count = 0
+        self.miss_count = 0
+        self._view_version = None
+        self._old_releases = {}
+        self._new_releases = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') == RELEASE_MANIFEST_FORMAT:
+                self._old_releases = data['releases']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass # Missing or corrupt; start from scratch (it will be overwritten by save())
+
+    def fingerprint(self, release, since, options):
+        '''
+        Returns the key under which the rendered form of the given release is stored.
+
+        ``since`` is the text of the release's "since" clause (which depends on the ancestry graph beyond the
+        release itself), and ``options`` is a list of everything else that can change how the release renders.
+
+        Returns ``None`` if the release can't be stored, because its data could be confused with UID placeholders.
+        '''
+        if self._view_version is None:
+            self._view_version = _view_version()
+        blob = json.dumps([RELEASE_MANIFEST_FORMAT, self._view_version, options, since,
+                           release.get('name'), release.get('after'), release.get('notes')],
+                          sort_keys=True, default=str)
+        if '\\ue000' in blob or '\\ue001' in blob: # (Json escapes all non-ASCII characters by default)
+            return None
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def has(self, fingerprint):
+        '''
+        Returns whether or not a release with the given fingerprint is stored.
+        '''
+        return fingerprint in self._new_releases or fingerprint in self._old_releases
+
+    def get(self, fingerprint):
+        '''
+        Returns ``(uid_count, html, blob_fallbacks)`` for the release with the given fingerprint, or ``None`` if
+        there isn't one.  ``blob_fallbacks`` is the list given to ``put()``.
+        '''
+        entry = self._new_releases.get(fingerprint) or self._old_releases.get(fingerprint)
+        if entry is None:
+            self.miss_count = self.miss_count + 1
+            return None
+        self.hit_count = self.hit_count + 1
+        self._new_releases[fingerprint] = entry
+        return entry['uid_count'], entry['html'], entry['blob_fallbacks']
+
+    def put(self, fingerprint, uid_count, html, blob_fallbacks):
+        '''
+        Stores the rendered form of a release, unless it contains something that can't be re-used outside of the
+        render that produced it.
+
+        ``blob_fallbacks`` is a list of ``[key, fallback]`` (``fallback`` being ``QANotesBlobFallback.as_dict()``)
+        for each over-budget blob in the release, so that they can be reported again whenever the release is used.
+        '''
+        if qa_notes_is_fragment_cacheable(SeanoHtmlFragment(html=html)):
+            self._new_releases[fingerprint] = {'uid_count': uid_count, 'html': html, 'blob_fallbacks': blob_fallbacks}
+
+    def save(self):
+        '''
+        Atomically replaces the manifest file with the releases used (or rendered) since it was loaded (or last
+        saved), and starts over from those for the next build.
+        '''
+        self._old_releases = self._new_releases
+        self._new_releases = {}
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'format': RELEASE_MANIFEST_FORMAT, 'releases': self._old_releases}, f)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,51 @@
+"""
+src/seano_formatter_qa_notes/renderer_pool.py
+
+Infrastructure to compile markup with warmed-up markup engines, rather than constructing new ones for every blob
+"""
+import threading
+import markdown
+from .shared.html_buf import SeanoHtmlFragment
+from .shared.markup import SeanoMarkdown
+
+# Must match the extensions used by SeanoMarkdown.toHtmlBlock() in the shared markup module
+_MARKDOWN_EXTENSIONS = ['pymdownx.superfences', 'pymdownx.highlight']
+
+# Markup engines aren't thread-safe; each thread gets its own
+_engines = threading.local()
+
+
+class _PooledMarkdown(SeanoMarkdown):
+    '''
+    A ``SeanoMarkdown`` that compiles itself with the given (already configured) ``markdown.Markdown`` engine,
+    instead of constructing one (and loading all of its extensions) from scratch.
+    '''
+    def __init__(self, payload, engine):
+        super().__init__(payload=payload)
+        self.engine = engine
+
+    def toHtmlBlock(self):
+        self.engine.reset()
+        return SeanoHtmlFragment(html=self.engine.convert(self.payload))
+
+
+def _get_markdown_engine():
+    engine = getattr(_engines, 'markdown', None)
+    if engine is None:
+        engine = markdown.Markdown(extensions=_MARKDOWN_EXTENSIONS)
+        _engines.markdown = engine
+    return engine
+
+
+def qa_notes_render_markup(markup, mode):
+    '''
+    Equivalent to ``markup.toHtmlBlock()`` (if ``mode`` is ``'block'``) or ``markup.toHtmlLine()`` (otherwise),
+    except that Markdown is compiled with a Markdown engine that is configured once per thread, and reset between
+    uses.
+
+    Other markup flavors are compiled as usual.  (DocUtils builds its settings inside the shared markup plumbing,
+    which offers no way to supply pre-built ones.)
+    '''
+    if markup.__class__ is SeanoMarkdown:
+        markup = _PooledMarkdown(markup.payload, _get_markdown_engine())
+    return markup.toHtmlBlock() if mode == 'block' else markup.toHtmlLine()
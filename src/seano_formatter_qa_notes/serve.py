@@ -0,0 +1,239 @@
+"""
+src/seano_formatter_qa_notes/serve.py
+
+Infrastructure to preview the QA Notes page while writing notes: a long-lived process that re-renders the page
+whenever its inputs change, and serves the latest page over HTTP
+"""
+import http.server
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from .blob_budget import qa_notes_report_blob_fallbacks
+from .profiler import qa_notes_profile_phase
+from .query_reader import qa_notes_read_query
+from .release_manifest import QANotesReleaseManifest
+from .shared.html_buf import html_escape as escape
+
+# How often (in seconds) the watched files are checked for changes (by default)
+DEFAULT_POLL_INTERVAL = 0.5
+
+# How often (in seconds) an idle change notification stream sends something, so that proxies don't time it out
+_KEEP_ALIVE_INTERVAL = 15.0
+
+# Added to the end of every served page: reloads the page as soon as a newer version of it is available.  The
+# server sends the current version when the event stream connects, and again whenever it changes.
+_LIVE_RELOAD_JS = '''<script>
+new EventSource('/events').onmessage = function(e) {
+    if (e.data !== '%s') location.reload();
+};
+</script>'''
+
+
+def _snapshot_paths(paths):
+    '''
+    Returns something that changes whenever any file in the given files or directories (recursively) is added,
+    removed, or modified.  Hidden files and directories (such as ``.git``) are ignored.
+    '''
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            try:
+                st = os.stat(path)
+                result.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                result.append((path, None, None))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted([x for x in dirs if not x.startswith('.')])
+            for name in sorted(files):
+                if name.startswith('.'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue # Deleted while walking; the next snapshot will notice
+                result.append((os.path.join(root, name), st.st_mtime_ns, st.st_size))
+    return result
+
+
+class QANotesLiveServer(object):
+    '''
+    Renders the QA Notes page whenever the watched files change, and serves the latest page over HTTP.
+
+    The query output is read either from a file (``src``), or from the standard output of a shell command
+    (``query_command``, such as ``seano query``), which is run again on every change to the watched paths (such as
+    the seano database directory).
+
+    Everything that makes a render fast is kept between renders by the given ``QANotesRenderInfrastructure``
+    (warmed-up markup engines, rendered markup and tickets, and parsed notes), plus an in-memory
+    ``QANotesReleaseManifest``, so that releases that didn't change aren't rendered again at all.  Usually, only the
+    release being worked on (and within it, only the notes that changed) is re-rendered.  Give the infrastructure a
+    ``memo_max_entries`` limit, so that old versions of edited notes don't accumulate in its memos.  Its fragment
+    cache (if any) is trimmed after every render, for the same reason.
+
+    Served pages reload themselves (via a Server-Sent Events stream at ``/events``) when a newer page is available.
+    If rendering fails, the error is served instead of the page, until the next successful render.
+    '''
+    def __init__(self, infrastructure, src=None, query_command=None, watch_paths=None,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.infrastructure = infrastructure
+        self.src = src
+        self.query_command = query_command
+        self.watch_paths = watch_paths or [src]
+        self.poll_interval = poll_interval
+        self.infrastructure.manifest = QANotesReleaseManifest(None)
+        self._changed = threading.Condition()
+        self._version = 0
+        self._page = ''
+
+    def get_page(self):
+        '''
+        Returns ``(version, html)`` of the latest rendered page.
+        '''
+        with self._changed:
+            return self._version, self._page
+
+    def wait_for_change(self, version, timeout):
+        '''
+        Waits until the version of the latest rendered page is not the given version (or until the timeout
+        expires), and returns the version of the latest rendered page.
+        '''
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout=timeout)
+            return self._version
+
+    def _publish(self, html):
+        head, sep, tail = html.rpartition('</body>')
+        if not sep:
+            head, tail = html, ''
+        with self._changed:
+            self._version = self._version + 1
+            self._page = ''.join([head, _LIVE_RELOAD_JS % (self._version,), sep, tail])
+            self._changed.notify_all()
+
+    def read_query(self):
+        '''
+        Returns a ``SeanoMetaCache`` of the current query output.
+        '''
+        release_count = self.infrastructure.release_count
+        if self.query_command is None:
+            with open(self.src, 'r') as f:
+                return qa_notes_read_query(f, release_count=release_count)
+        proc = subprocess.run(self.query_command, shell=True, check=True, stdout=subprocess.PIPE,
+                              universal_newlines=True)
+        return qa_notes_read_query(io.StringIO(proc.stdout), release_count=release_count)
+
+    def render(self):
+        '''
+        Renders the page from the current query output, and publishes it (or the error, if rendering fails).
+        '''
+        manifest = self.infrastructure.manifest
+        hit_count, miss_count = manifest.hit_count, manifest.miss_count
+        start = time.perf_counter()
+        try:
+            with qa_notes_profile_phase(self.infrastructure.profiler, 'load'):
+                cmc = self.read_query()
+            html = self.infrastructure.run(cmc)
+        except Exception: #pylint: disable=W0703
+            message = traceback.format_exc()
+            sys.stderr.write(message)
+            self._publish('<html><head><title>QA Notes: error</title></head><body><h2>Unable to render the QA Notes'
+                          '</h2><pre>%s</pre></body></html>' % (escape(message),))
+            return
+        manifest.save() # (In memory only; sets up the releases rendered here to be re-used by the next render)
+        self._publish(html)
+        if self.infrastructure.fragment_cache is not None:
+            # Every edit adds entries to the cache; keep it within its size limit for as long as the server runs:
+            with qa_notes_profile_phase(self.infrastructure.profiler, 'cache_trim'):
+                self.infrastructure.fragment_cache.trim()
+        qa_notes_report_blob_fallbacks(self.infrastructure.blob_fallbacks, sys.stderr, page='QA Notes')
+        sys.stderr.write('Rendered the QA Notes in %.2f seconds (%d releases re-used, %d rendered)\n' % (
+            time.perf_counter() - start, manifest.hit_count - hit_count, manifest.miss_count - miss_count))
+
+    def make_http_server(self, host, port):
+        '''
+        Returns an HTTP server (not yet serving) that serves the latest page at ``/``, and change notifications at
+        ``/events``.
+        '''
+        server = http.server.ThreadingHTTPServer((host, port), _QANotesRequestHandler)
+        server.live_server = self
+        return server
+
+    def serve_forever(self, host, port):
+        '''
+        Renders the page, then serves it on the given address, re-rendering it whenever the watched paths change,
+        until interrupted.
+        '''
+        self.render()
+        server = self.make_http_server(host, port)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        sys.stderr.write('Serving the QA Notes at http://%s:%d/ (press Ctrl-C to stop)\n' % server.server_address[:2])
+        snapshot = _snapshot_paths(self.watch_paths)
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                new_snapshot = _snapshot_paths(self.watch_paths)
+                if new_snapshot == snapshot:
+                    continue
+                # Wait for the files to stop changing (editors and seano often write several files in a row):
+                while True:
+                    snapshot = new_snapshot
+                    time.sleep(self.poll_interval)
+                    new_snapshot = _snapshot_paths(self.watch_paths)
+                    if new_snapshot == snapshot:
+                        break
+                self.render()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class _QANotesRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self): #pylint: disable=C0103
+        live_server = self.server.live_server
+        path = self.path.partition('?')[0]
+        if path == '/events':
+            self._send_events(live_server)
+        elif path in ['/', '/index.html']:
+            _, html = live_server.get_page()
+            self._send(200, 'text/html; charset=utf-8', html.encode('utf-8'))
+        else:
+            self._send(404, 'text/plain; charset=utf-8', b'Not found\n')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, live_server):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        version, _ = live_server.get_page()
+        try:
+            self.wfile.write(('data: %s\n\n' % (version,)).encode('utf-8'))
+            self.wfile.flush()
+            while True:
+                new_version = live_server.wait_for_change(version, timeout=_KEEP_ALIVE_INTERVAL)
+                if new_version == version:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    version = new_version
+                    self.wfile.write(('data: %s\n\n' % (version,)).encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The page was closed (or reloaded)
+
+    def log_message(self, format, *args): #pylint: disable=W0622
+        pass # Every page reload would otherwise log two lines
@@ -0,0 +1,85 @@
+"""
+tests/test_ancestry_index.py
+
+Unit tests for the bitset release ancestry index
+"""
+import json
+import random
+import pytest
+from seano_formatter_qa_notes.ancestry_index import QANotesAncestryIndex, qa_notes_minimum_descendant_list
+from seano_formatter_qa_notes.shared.metacache import SeanoMetaCache
+from seano_formatter_qa_notes.shared.schema_plumbing import seano_minimum_descendant_list
+
+
+def _make_releases(rnd, release_count, max_parents, dangling_chance, missing_after_chance):
+    # Releases are listed newest first; parents ("after") are always older, so the graph is acyclic
+    names = ['r%d' % (i,) for i in range(release_count)]
+    releases = []
+    for i, name in enumerate(names):
+        older = names[i + 1:]
+        after = [{'name': x} for x in rnd.sample(older, rnd.randint(0, min(max_parents, len(older))))]
+        if rnd.random() < dangling_chance:
+            after.append({'name': 'ghost'})
+        release = {'name': name, 'before': [], 'after': after}
+        if rnd.random() < missing_after_chance:
+            del release['after']
+        releases.append(release)
+    return names, releases
+
+
+def _outcome(func, bag, releases):
+    # Each call gets its own metacache, so that no caches are shared between the two implementations
+    try:
+        return func(list(bag), SeanoMetaCache(json.dumps({'releases': releases})))
+    except (KeyError, RecursionError) as e:
+        return type(e)
+
+
+def _random_bags(rnd, names, count):
+    for _ in range(count):
+        pool = names + ['ghost'] if rnd.random() < 0.05 else names
+        yield [rnd.choice(pool) for _ in range(rnd.randint(0, 6))]
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_matches_shared_plumbing_on_random_graphs(seed):
+    rnd = random.Random(seed)
+    names, releases = _make_releases(rnd, rnd.randint(1, 40), max_parents=4, dangling_chance=0.03,
+                                     missing_after_chance=0.02)
+    for bag in _random_bags(rnd, names, 30):
+        assert _outcome(qa_notes_minimum_descendant_list, bag, releases) == \
+            _outcome(seano_minimum_descendant_list, bag, releases), (bag, releases)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_shared_plumbing_on_graphs_with_cycles(seed):
+    rnd = random.Random(seed)
+    # At most one parent each, so that the shared plumbing fails quickly (rather than exponentially) on the cycle:
+    names, releases = _make_releases(rnd, rnd.randint(2, 15), max_parents=1, dangling_chance=0.05,
+                                     missing_after_chance=0.0)
+    cycle_start = rnd.randrange(len(names) - 1)
+    for i in range(cycle_start, len(names) - 1):
+        releases[i]['after'] = [{'name': names[i + 1]}]
+    releases[-1]['after'] = [{'name': names[cycle_start]}]
+    assert not QANotesAncestryIndex(SeanoMetaCache(json.dumps({'releases': releases}))).is_usable
+    for bag in _random_bags(rnd, names, 10):
+        assert _outcome(qa_notes_minimum_descendant_list, bag, releases) == \
+            _outcome(seano_minimum_descendant_list, bag, releases), (bag, releases)
+
+
+def test_index_answers_without_falling_back():
+    releases = [
+        {'name': '3.0', 'before': [], 'after': [{'name': '2.1'}, {'name': '2.0'}]},
+        {'name': '2.1', 'before': [], 'after': [{'name': '1.0'}]},
+        {'name': '2.0', 'before': [], 'after': [{'name': '1.0'}]},
+        {'name': '1.0', 'before': [], 'after': []},
+        {'name': 'odd', 'before': [], 'after': [{'name': 'ghost'}]},
+    ]
+    index = QANotesAncestryIndex(SeanoMetaCache(json.dumps({'releases': releases})))
+    assert index.is_usable
+    assert index.minimum_descendant_list(['1.0', '2.0', '2.1']) == ['2.0', '2.1']
+    assert index.minimum_descendant_list(['1.0', '3.0', '1.0']) == ['3.0']
+    assert index.minimum_descendant_list([]) == []
+    # Left to the shared plumbing, which reports the problem:
+    assert index.minimum_descendant_list(['odd', '1.0']) is None
+    assert index.minimum_descendant_list(['ghost']) is None
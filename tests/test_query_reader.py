@@ -0,0 +1,94 @@
+"""
+tests/test_query_reader.py
+
+Unit tests for the incremental seano query output reader
+"""
+import io
+import json
+import pytest
+from seano_formatter_qa_notes.query_reader import _JsonStreamReader, qa_notes_read_query
+
+
+def _make_query(release_count):
+    releases = []
+    for i in range(release_count):
+        releases.append({
+            'name': '1.%d' % (i,),
+            'before': [{'name': '1.%d' % (i + 1,)}] if i + 1 < release_count else [],
+            'after': [{'name': '1.%d' % (i - 1,)}] if i > 0 else [],
+            'notes': [{
+                'id': '%032x' % (i * 10 + j,),
+                'risk': j,
+                'ratio': 0.5 + j,
+                'flag': j % 2 == 0 or None,
+                'qa': {'en-US': 'Check "quoted" things \\ and ünïcödé; ☃ </script>'},
+                'tickets': ['https://example.com/ticket/%d' % (i * 10 + j,)],
+            } for j in range(3)],
+        })
+    return {
+        'project_name': {'en-US': 'Test Project'},
+        'current_version': releases[0]['name'] if releases else '0.0',
+        'empty': {},
+        'nothing': [],
+        'releases': releases,
+        'big_number': 12345678901234567890,
+        'negative': -1.5e-3,
+    }
+
+
+def _expected(query, release_count):
+    expected = json.loads(json.dumps(query))
+    for release in expected['releases'][release_count:]:
+        release.pop('notes', None)
+    return expected
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 64 * 1024])
+@pytest.mark.parametrize('release_count', [0, 1, 3, 100])
+def test_read_query_matches_json_loads(indent, chunk_size, release_count):
+    query = _make_query(5)
+    txt = json.dumps(query, indent=indent, ensure_ascii=False)
+    cmc = qa_notes_read_query(io.StringIO(txt), release_count=release_count, chunk_size=chunk_size)
+    assert cmc.everything == _expected(json.loads(txt), release_count)
+    assert [x['name'] for x in cmc.releases] == [x['name'] for x in query['releases']]
+    assert set(cmc.named_releases) == set(x['name'] for x in query['releases'])
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 64 * 1024])
+@pytest.mark.parametrize('txt', ['{"releases": []}', ' { "releases" : [ ] } ', '{"releases": [], "a": [1, 2.5, "x"]}\n',
+                                 '{"a": -0.5e-7, "releases": [], "b": 1E+2}'])
+def test_read_query_small_documents(chunk_size, txt):
+    cmc = qa_notes_read_query(io.StringIO(txt), release_count=1, chunk_size=chunk_size)
+    assert cmc.everything == json.loads(txt)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 64 * 1024])
+def test_reader_values_match_json_loads(chunk_size):
+    values = [0, 7, -12, 3.25, 1e100, 12345678901234567890, 'a string', '', True, False, None, [], {},
+              [1, [2, [3]]], {'a': {'b': [None, 'c']}}]
+    reader = _JsonStreamReader(io.StringIO(' '.join(json.dumps(x) for x in values)), chunk_size=chunk_size)
+    assert [reader.value() for _ in values] == values
+    assert reader.peek() == ''
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64 * 1024])
+@pytest.mark.parametrize('txt', [
+    '{"releases": []} x',          # Trailing data
+    '{"releases": []}{}',          # Trailing document
+    '{"releases": [],}',           # Trailing comma in an object
+    '{"releases": [{"name": "1.0"},]}', # Trailing comma in the releases
+    '[]',                          # Top level is not an object
+    '"releases"',
+    '42',
+    '',
+    '{"releases": [',              # Truncated
+    '{"releases": [{"name": "1.0"}',
+    '{"releases" []}',             # Missing colon
+    '{1: []}',                     # Non-string key
+    '{"a": 1 "b": 2}',             # Missing comma
+    '{"releases": {}}',            # Releases is not a list
+])
+def test_read_query_rejects_malformed_documents(chunk_size, txt):
+    with pytest.raises(ValueError):
+        qa_notes_read_query(io.StringIO(txt), release_count=1, chunk_size=chunk_size)
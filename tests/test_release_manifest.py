@@ -0,0 +1,140 @@
+"""
+tests/test_release_manifest.py
+
+Unit tests that re-using rendered releases (from the release manifest) and rendering markup ahead of time (with
+several jobs) produce exactly the same page as a plain render
+"""
+import copy
+import datetime
+import io
+import pytest
+from seano_formatter_qa_notes.qa_notes import compile_qa_notes
+from seano_formatter_qa_notes.release_manifest import QANotesReleaseManifest, qa_notes_resolve_uid_tokens, \
+    qa_notes_uid_token
+from seano_formatter_qa_notes.shared import markup as markup_module
+
+_BUILD_TIME = datetime.datetime(2020, 1, 2, 3, 4, tzinfo=datetime.timezone.utc)
+
+_RELEASE_NAMES = ['HEAD', 'v4.0', 'v3.0', 'v2.0', 'v1.0']
+
+
+def _make_query():
+    def note(i, **fields):
+        result = {'id': '%030x' % (i,), 'tickets': ['https://example.com/t/T-%d' % (i,)]}
+        result.update(fields)
+        return result
+    names = _RELEASE_NAMES
+    notes = {
+        'HEAD': [
+            note(1, **{'employee-short-loc-hlist-md': {'en-US': ['Short `thing`', {'Parent': ['child a', 'child b']}],
+                                                       'fr-FR': ['Chose']},
+                       'qa-technical-loc-md': {'en-US': 'Test *this*:\n\n1.  thing\n2.  other\n'}}),
+        ],
+        'v4.0': [
+            # Mermaid diagrams have process-unique ids, so this release is never stored in the manifest:
+            note(2, **{'employee-short-loc-hlist-rst': {'en-US': ['A diagram']},
+                       'qa-technical-loc-rst': {'en-US': 'Look:\n\n.. mermaid::\n\n    flowchart LR\n    A --> B\n'}}),
+        ],
+        'v3.0': [
+            note(3, **{'employee-short-loc-hlist-rst': {'en-US': ['Code ``x``'], 'fr-FR': ['Du code']},
+                       'employee-technical-loc-rst': {'en-US': 'Some *technical* text.\n'},
+                       'qa-technical-loc-rst': {'en-US': 'Test:\n\n.. code-block:: python\n\n    def f(x):\n'
+                                                         '        return x\n', 'fr-FR': 'Tester'}}),
+            note(4, **{'customer-short-loc-hlist-md': {'en-US': ['Customer thing']},
+                       'mc-technical-loc-md': {'en-US': 'Tell *them*.\n'}}),
+        ],
+        'v2.0': [
+            # Looks like a UID placeholder, so this release is never stored in the manifest:
+            note(5, **{'employee-short-loc-hlist-md': {'en-US': ['Odd \ue0007\ue001 text']}}),
+        ],
+        'v1.0': [
+            note(6, **{'employee-short-loc-hlist-md': {'en-US': ['First']},
+                       'qa-technical-loc-md': {'en-US': 'Nothing to test.\n'}}),
+        ],
+    }
+    releases = []
+    for i, name in enumerate(names):
+        releases.append({
+            'name': name,
+            'commit': None if name == 'HEAD' else '%040x' % (i,),
+            'after': [{'name': names[i + 1]}] if i + 1 < len(names) else [],
+            'before': [{'name': names[i - 1]}] if i > 0 else [],
+            'notes': notes[name],
+        })
+    return {
+        'project_name': {'en-US': 'Test <Project>', 'fr-FR': 'Projet'},
+        'current_version': 'HEAD',
+        'build-uniqueness-list-md': {'en-US': ['Flag `x`']},
+        'releases': releases,
+    }
+
+
+def _render(query, **options):
+    # Mermaid diagram ids are numbered per process; start each page from the same number:
+    markup_module._MERMAID_AUTO_INIT_KEY = 0 #pylint: disable=W0212
+    out = io.StringIO()
+    compile_qa_notes(query, out, build_time=_BUILD_TIME, **options)
+    return out.getvalue()
+
+
+_OPTION_SETS = [
+    {},
+    {'compact': True},
+    {'lazy': True},
+    {'locale': 'fr-FR'},
+    {'release_count': 2},
+    {'blob_max_bytes': 40},
+]
+
+
+@pytest.mark.parametrize('options', _OPTION_SETS)
+def test_manifest_cold_and_warm_match_plain_render(tmp_path, options):
+    query = _make_query()
+    path = str(tmp_path / 'manifest.json')
+
+    manifest = QANotesReleaseManifest(path)
+    assert _render(query, manifest=manifest, **options) == _render(query, **options)
+    manifest.save()
+
+    # Edit one release; everything else (but the releases that can't be stored) is re-used:
+    edited = copy.deepcopy(query)
+    edited['releases'][0]['notes'][0]['qa-technical-loc-md'] = {'en-US': 'Test *that* instead.\n'}
+    manifest = QANotesReleaseManifest(path)
+    assert _render(edited, manifest=manifest, **options) == _render(edited, **options)
+    shown = _RELEASE_NAMES[:options.get('release_count', len(_RELEASE_NAMES))]
+    reusable = ['v3.0', 'v1.0']
+    if 'blob_max_bytes' in options:
+        reusable.append('v4.0') # (The diagram is too large to render, and is shown as plain text instead)
+    assert manifest.hit_count == len(set(shown) & set(reusable))
+    manifest.save()
+
+    # And once more, with nothing changed:
+    manifest = QANotesReleaseManifest(path)
+    assert _render(edited, manifest=manifest, **options) == _render(edited, **options)
+
+
+@pytest.mark.parametrize('options', [x for x in _OPTION_SETS if x and 'release_count' not in x])
+def test_manifest_is_not_shared_between_options(tmp_path, options):
+    query = _make_query()
+    path = str(tmp_path / 'manifest.json')
+    manifest = QANotesReleaseManifest(path)
+    _render(query, manifest=manifest)
+    manifest.save()
+    manifest = QANotesReleaseManifest(path)
+    assert _render(query, manifest=manifest, **options) == _render(query, **options)
+    assert manifest.hit_count == 0
+
+
+@pytest.mark.parametrize('options', [{}, {'compact': True}, {'lazy': True}])
+def test_jobs_match_plain_render(tmp_path, options):
+    query = _make_query()
+    assert _render(query, jobs=2, **options) == _render(query, **options)
+    manifest = QANotesReleaseManifest(str(tmp_path / 'manifest.json'))
+    assert _render(query, jobs=2, manifest=manifest, **options) == _render(query, **options)
+
+
+def test_uid_tokens_are_remapped_after_the_base_uid():
+    html = '<a id="x%s" href="#x%s">%s</a>' % (qa_notes_uid_token(1), qa_notes_uid_token(12), qa_notes_uid_token(3))
+    assert qa_notes_resolve_uid_tokens(html, 0) == '<a id="x1" href="#x12">3</a>'
+    assert qa_notes_resolve_uid_tokens(html, 100) == '<a id="x101" href="#x112">103</a>'
+    assert qa_notes_resolve_uid_tokens('no tokens x', 5) == 'no tokens x'